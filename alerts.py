@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+import zstandard as zstd
+
+from utils import DB_PATH, BACKUP_ZSTD_LEVEL, get_pool, flush_audit_log, result_cache
+
+# ------------------- CONFIG ------------------- #
+ALERTS_PAGE_SIZE = 10
+AUDIT_RETENTION_DAYS = 30                 # older audit_log rows move to the archive
+ARCHIVE_BATCH_ROWS = 5000                 # rows per compressed archive block
+ARCHIVE_CHECK_INTERVAL = 3600             # seconds between automatic rollovers
+
+AUDIT_COLUMNS = ["id", "user", "action", "table_name", "record_id", "details", "timestamp"]
+_SELECT = f"SELECT {', '.join(AUDIT_COLUMNS)} FROM audit_log"
+
+
+def _filters(user=None, action=None, table=None, since=None) -> tuple:
+    """WHERE terms + params for the optional feed filters"""
+    terms, params = [], []
+    for column, value in (("user", user), ("action", action), ("table_name", table)):
+        if value:
+            terms.append(f"{column} = ?")
+            params.append(value)
+    if since:
+        terms.append("timestamp >= ?")
+        params.append(since)
+    return terms, params
+
+
+# ------------------- FEED ------------------- #
+def fetch_alerts(before_id=None, limit=ALERTS_PAGE_SIZE, user=None, action=None, table=None,
+                 since=None, db_path=DB_PATH) -> dict:
+    """
+    One page of audit events, newest first (keyset pagination on id):
+    pass the returned `next_before_id` to get the following page.
+    Only the requested rows are read, however large audit_log grows.
+    """
+    terms, params = _filters(user, action, table, since)
+    if before_id is not None:
+        terms.append("id < ?")
+        params.append(before_id)
+    where = f" WHERE {' AND '.join(terms)}" if terms else ""
+    try:
+        with get_pool(db_path).connection() as conn:
+            rows = conn.execute(f"{_SELECT}{where} ORDER BY id DESC LIMIT ?;", params + [limit + 1]).fetchall()
+    except Exception as e:
+        return {"error": str(e)}
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "columns": AUDIT_COLUMNS,
+        "rows": rows,
+        "next_before_id": rows[-1][0] if has_more else None,
+    }
+
+
+def poll_alerts(since_id=0, limit=100, user=None, action=None, table=None, db_path=DB_PATH) -> dict:
+    """Events newer than `since_id` (oldest first) and the id to poll from next"""
+    terms, params = _filters(user, action, table)
+    terms.append("id > ?")
+    params.append(since_id or 0)
+    try:
+        with get_pool(db_path).connection() as conn:
+            rows = conn.execute(f"{_SELECT} WHERE {' AND '.join(terms)} ORDER BY id LIMIT ?;",
+                                params + [limit]).fetchall()
+    except Exception as e:
+        return {"error": str(e)}
+    return {"columns": AUDIT_COLUMNS, "rows": rows, "last_id": rows[-1][0] if rows else since_id}
+
+
+def latest_alert_id(db_path=DB_PATH) -> int:
+    with get_pool(db_path).connection() as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM audit_log;").fetchone()[0]
+
+
+def alert_filter_values(db_path=DB_PATH) -> dict:
+    """Distinct users / actions / tables for filter widgets (index scans)"""
+    with get_pool(db_path).connection() as conn:
+        return {
+            column: [r[0] for r in conn.execute(
+                f"SELECT DISTINCT {column} FROM audit_log WHERE {column} IS NOT NULL ORDER BY {column};")]
+            for column in ("user", "action", "table_name")
+        }
+
+
+# ------------------- ARCHIVE ------------------- #
+def _ensure_archive_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS audit_log_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_timestamp TEXT,
+            last_timestamp TEXT,
+            row_count INTEGER NOT NULL,
+            data BLOB NOT NULL,           -- zstd-compressed JSON rows (AUDIT_COLUMNS order)
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def archive_alerts(older_than_days=AUDIT_RETENTION_DAYS, batch_rows=ARCHIVE_BATCH_ROWS, db_path=DB_PATH) -> dict:
+    """
+    Move audit_log rows older than `older_than_days` into audit_log_archive,
+    `batch_rows` rows per compressed block, one transaction per block.
+    """
+    flush_audit_log(db_path)
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - older_than_days * 86400))
+    compressor = zstd.ZstdCompressor(level=BACKUP_ZSTD_LEVEL)
+    archived = blocks = 0
+    try:
+        with get_pool(db_path).connection() as conn:
+            _ensure_archive_table(conn)
+            conn.commit()
+            while True:
+                rows = conn.execute(f"{_SELECT} WHERE timestamp < ? ORDER BY id LIMIT ?;",
+                                    (cutoff, batch_rows)).fetchall()
+                if not rows:
+                    break
+                data = compressor.compress(json.dumps(rows, default=str).encode())
+                conn.execute("""
+                    INSERT INTO audit_log_archive
+                        (first_id, last_id, first_timestamp, last_timestamp, row_count, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (rows[0][0], rows[-1][0], min(str(r[6]) for r in rows),
+                      max(str(r[6]) for r in rows), len(rows), data))
+                conn.execute("DELETE FROM audit_log WHERE id <= ? AND timestamp < ?;", (rows[-1][0], cutoff))
+                conn.commit()
+                archived += len(rows)
+                blocks += 1
+    except Exception as e:
+        return {"success": False, "message": f"Archiving failed: {e}"}
+
+    if archived:
+        result_cache.invalidate_tables(os.path.abspath(db_path), ("audit_log", "audit_log_archive"))
+    return {"success": True, "message": f"Archived {archived} audit rows in {blocks} block(s)",
+            "archived": archived, "blocks": blocks}
+
+
+def read_archive(first_id=None, last_id=None, db_path=DB_PATH) -> list:
+    """Archived audit rows with first_id <= id <= last_id (decompressed per block)"""
+    decompressor = zstd.ZstdDecompressor()
+    rows = []
+    with get_pool(db_path).connection() as conn:
+        _ensure_archive_table(conn)
+        blocks = conn.execute("""
+            SELECT data FROM audit_log_archive
+            WHERE last_id >= ? AND first_id <= ? ORDER BY first_id;
+        """, (first_id or 0, last_id if last_id is not None else 2 ** 63 - 1)).fetchall()
+    for (data,) in blocks:
+        for row in json.loads(decompressor.decompress(data)):
+            if (first_id is None or row[0] >= first_id) and (last_id is None or row[0] <= last_id):
+                rows.append(tuple(row))
+    return rows
+
+
+_last_rollover = {}
+_rollover_lock = threading.Lock()
+
+
+def maybe_archive_alerts(db_path=DB_PATH, interval=ARCHIVE_CHECK_INTERVAL):
+    """Run archive_alerts at most once per `interval` seconds per process"""
+    key = os.path.abspath(db_path)
+    with _rollover_lock:
+        if time.monotonic() - _last_rollover.get(key, float("-inf")) < interval:
+            return None
+        _last_rollover[key] = time.monotonic()
+    return archive_alerts(db_path=db_path)
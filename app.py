@@ -1,12 +1,22 @@
 # app.py — Soft Gradient Website style (complete)
 import os
 import re
+import html
 import time
 import random
+import logging
+from contextlib import contextmanager
 import pandas as pd
 import streamlit as st
-from rag_model import llm_sql
-from utils import execute_sql_query, log_db_action, create_backup, restore_backup
+from streamlit.errors import StreamlitAPIException
+from index_advisor import ensure_baseline_indexes
+from prompt_builder import get_schema_snapshot
+from utils import (log_db_action, create_backup, restore_backup, list_backups,
+                   fetch_result_page, flush_audit_log, get_pool, get_schema_fingerprint,
+                   PAGE_SIZE, BACKUP_DIR, DB_PATH)
+from backup_store import get_backup_store
+from tracing import tracer
+from alerts import fetch_alerts, poll_alerts, latest_alert_id, alert_filter_values, maybe_archive_alerts
 
 # ---------------- page config ----------------
 st.set_page_config(
@@ -15,10 +25,52 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+logger = logging.getLogger(__name__)
+SHOW_RENDER_TIMES = os.getenv("SHOW_RENDER_TIMES", "0") == "1"
+
+# ---------------- process-wide resources (survive reruns and sessions) ----------------
+@st.cache_resource
+def get_llm():
+    """rag_model (Groq clients, translation cache) is imported once per process"""
+    from rag_model import llm_sql
+    return llm_sql
+
+@st.cache_resource
+def get_db_pool():
+    """Pooled connections to the company DB, baseline indexes checked once"""
+    ensure_baseline_indexes()
+    return get_pool(DB_PATH)
+
+@st.cache_resource
+def get_schema(fingerprint):
+    """Schema snapshot, re-read only when the schema fingerprint changes"""
+    return get_schema_snapshot()
+
+@st.cache_data(ttl=30)
+def get_alert_filter_values():
+    return alert_filter_values()
+
+@contextmanager
+def timed_render(name):
+    """Measure server-side render time of a page or fragment run (tracer stage "render <name>")"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        tracer.record(f"render {name}", elapsed)
+        logger.info("render %s: %.1f ms", name, elapsed)
+        if SHOW_RENDER_TIMES:
+            summary = tracer.snapshot()["latency_ms"].get(f"render {name}", {})
+            st.caption(f"⏱ {name}: {elapsed:.1f} ms (median {summary.get('p50') or elapsed:.1f} ms "
+                       f"over {summary.get('count', 1)} runs)")
+
+get_db_pool()
+
 # ---------------- style (soft gradients + pastel) ----------------
-def apply_soft_gradient_theme():
-    st.markdown(
-        """
+@st.cache_resource
+def theme_css():
+    return """
     <style>
     :root{
       --bg1: #f7fbff;
@@ -110,9 +162,10 @@ def apply_soft_gradient_theme():
     .muted { color: var(--muted); font-size:14px; }
     .sql-box { background: linear-gradient(180deg,#fff7fb,#f7fbff); padding:12px; border-radius:8px; border-left:4px solid #4f46e5; font-family: monospace; white-space: pre-wrap; }
     </style>
-    """,
-        unsafe_allow_html=True,
-    )
+    """
+
+def apply_soft_gradient_theme():
+    st.markdown(theme_css(), unsafe_allow_html=True)
 
 
 # ---------------- session timeout ----------------
@@ -142,11 +195,75 @@ if "authenticated" not in st.session_state:
 def go_to(page_name):
     st.session_state["page"] = page_name
 
+def rerun_panel():
+    """Rerun only the current fragment (panel); falls back to a full rerun"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:   # fragment is running as part of a full app run
+        st.rerun()
+
 def preprocess_query(user_question: str) -> str:
     user_question = re.sub(r"```.*?```", "", user_question, flags=re.DOTALL)
     user_question = re.sub(r"^\s*(SQL:|SQL Query:)", "", user_question, flags=re.IGNORECASE).strip()
     return user_question
 
+def render_query_result(result):
+    """Render an execute_sql_query result dict (no re-execution)"""
+    if isinstance(result, dict) and not result.get("error") and result.get("rows") is not None:
+        if result.get("corrections"):
+            st.info("Auto-corrected: " + ", ".join(f"{a} → {b}" for a, b in result["corrections"].items()))
+        if result["rows"]:
+            with tracer.span("render_dataframe", rows=len(result["rows"])):
+                df = pd.DataFrame(result["rows"], columns=result["columns"])
+                st.dataframe(df)
+            if result.get("truncated"):
+                st.warning(f"Showing the first {len(result['rows'])} rows — result truncated.")
+        elif result.get("columns"):
+            st.info("Query executed but no rows returned.")
+        else:
+            st.success(f"Query executed — {result.get('rowcount', 0)} row(s) affected.")
+    else:
+        st.error(result)
+
+def stream_question(question):
+    """Run the question through llm_sql.run_stream, showing output as it arrives"""
+    placeholder = st.empty()
+    streamed = ""
+    sql_shown = False
+    response = None
+    for event in get_llm().run_stream(question, user=st.session_state.get("username","system"),
+                                    page_size=PAGE_SIZE):
+        if event["type"] == "token" and not sql_shown:
+            streamed += event["text"]
+            placeholder.markdown(f"<div class='sql-box'>{html.escape(streamed)}</div>", unsafe_allow_html=True)
+        elif event["type"] == "sql":
+            sql_shown = True
+            placeholder.markdown(f"<div class='sql-box'>{event['sql']}</div>", unsafe_allow_html=True)
+        elif event["type"] == "done":
+            response = event["response"]
+    placeholder.empty()
+    return response
+
+def render_result_pages(sql_query, first_page):
+    """Show one page of a SELECT at a time; later pages are fetched on demand"""
+    page = st.session_state.get("ask_page", 0)
+    result = first_page if page == 0 else fetch_result_page(
+        sql_query, page=page, page_size=PAGE_SIZE, user=st.session_state.get("username","system"))
+    render_query_result(result)
+
+    if isinstance(result, dict) and "page" in result:
+        prev_col, info_col, next_col = st.columns([1,2,1])
+        with prev_col:
+            if st.button("◀ Prev", disabled=page == 0):
+                st.session_state["ask_page"] = page - 1
+                rerun_panel()
+        with info_col:
+            st.caption(f"Page {page + 1} · {PAGE_SIZE} rows per page")
+        with next_col:
+            if st.button("Next ▶", disabled=not result.get("has_next")):
+                st.session_state["ask_page"] = page + 1
+                rerun_panel()
+
 # ---------------- login screen ----------------
 def login_screen():
     apply_soft_gradient_theme()
@@ -225,7 +342,7 @@ def home_screen():
         st.markdown("<p class='muted'>Restore a previous backup if needed.</p>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
-    r2c1, r2c2 = st.columns([1.2,1.2])
+    r2c1, r2c2, r2c3 = st.columns([1.2,1.2,1.2])
     with r2c1:
         st.markdown("<div class='card'>", unsafe_allow_html=True)
         if st.button("🔔 Recent Alerts"):
@@ -234,6 +351,13 @@ def home_screen():
         st.markdown("</div>", unsafe_allow_html=True)
 
     with r2c2:
+        st.markdown("<div class='card'>", unsafe_allow_html=True)
+        if st.button("📈 Metrics"):
+            go_to("metrics")
+        st.markdown("<p class='muted'>Per-stage latency, token counts and rows returned.</p>", unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    with r2c3:
         st.markdown("<div class='card'>", unsafe_allow_html=True)
         if st.button("🔓 Logout"):
             st.session_state["authenticated"] = False
@@ -245,6 +369,18 @@ def home_screen():
 def ask_screen():
     apply_soft_gradient_theme()
     st.header("❓ Ask the Database (Natural Language → SQL)")
+    ask_panel()
+
+    if st.button("⬅ Back to Home"):
+        go_to("home")
+
+@st.fragment
+def ask_panel():
+    """Question, SQL and result pages; interactions rerun only this panel"""
+    with timed_render("ask panel"):
+        ask_panel_body()
+
+def ask_panel_body():
     question = st.text_input("Type your question here:", key="ask_input")
 
     col1, col2 = st.columns([1,2])
@@ -254,66 +390,105 @@ def ask_screen():
                 st.warning("Please type a question first.")
             else:
                 cleaned = preprocess_query(question)
-                response = llm_sql.run(cleaned, user=st.session_state.get("username","system"))
-                sql_query = response.get("sql")
-                results = response.get("results")
-                if sql_query:
-                    st.markdown("**Generated SQL:**")
-                    st.markdown(f"<div class='sql-box'>{sql_query}</div>", unsafe_allow_html=True)
-                    # run SQL
-                    execution = execute_sql_query(sql_query)
-                    if isinstance(execution, dict) and execution.get("rows") is not None:
-                        if execution["rows"]:
-                            df = pd.DataFrame(execution["rows"], columns=execution["columns"])
-                            st.dataframe(df)
-                        else:
-                            st.info("Query executed but no rows returned.")
-                    else:
-                        st.error(execution)
-                else:
-                    st.write("**Answer:**")
-                    st.write(results)
+                st.session_state["ask_response"] = stream_question(cleaned)
+                st.session_state["ask_page"] = 0
+                rerun_panel()
+
+        response = st.session_state.get("ask_response")
+        if response:
+            sql_query = response.get("sql")
+            results = response.get("results")
+            if sql_query:
+                st.markdown("**Generated SQL:**")
+                st.markdown(f"<div class='sql-box'>{sql_query}</div>", unsafe_allow_html=True)
+                render_result_pages(sql_query, results)
+                timings = response.get("timings", {})
+                st.caption("LLM: {} ms{} · DB: {} ms".format(
+                    timings.get("generate_ms"),
+                    " (cached)" if timings.get("cached") else
+                    " (template {}, confidence {:.0%})".format(timings["template"]["template"],
+                                                                timings["template"]["confidence"])
+                    if timings.get("template") else
+                    " ({})".format(timings["model"]) if timings.get("model") else "",
+                    timings.get("execute_ms")))
+            else:
+                st.write("**Answer:**")
+                st.write(results)
 
     with col2:
         st.markdown("<div class='card'><h4>Tips</h4><ul><li>Ask in plain language</li><li>Try: \"List active employees in HR\"</li><li>Use filters like \"salary > 50000\"</li></ul></div>", unsafe_allow_html=True)
-
-    if st.button("⬅ Back to Home"):
-        go_to("home")
+        with st.expander("📚 Tables"):
+            for table, info in get_schema(get_schema_fingerprint()).items():
+                st.markdown(f"**{table}**: {', '.join(info['columns'])}")
 
 # ---------------- BACKUP SCREEN ----------------
 def backup_screen():
     apply_soft_gradient_theme()
     st.header("📦 Create a Backup")
-    st.markdown("<div class='card'><p class='muted'>Backups are stored in the <code>backups/</code> folder. Keep only necessary backups to save disk space.</p></div>", unsafe_allow_html=True)
+    st.markdown("<div class='card'><p class='muted'>Snapshots are incremental: only changed chunks are stored in <code>backups/store/</code>, and old snapshots are pruned by the retention policy.</p></div>", unsafe_allow_html=True)
+    backup_panel()
 
+    if st.button("⬅ Back to Home"):
+        go_to("home")
+
+@st.fragment
+def backup_panel():
+    with timed_render("backup panel"):
+        backup_panel_body()
+
+def backup_panel_body():
+    def run_with_progress(action):
+        bar = st.progress(0.0, text="Starting backup…")
+
+        def on_progress(stage, done, total):
+            label = "Copying pages" if stage == "copy" else "Storing chunks" if stage == "chunk" else "Compressing"
+            offset = 0.0 if stage == "copy" else 0.5
+            bar.progress(offset + 0.5 * (done / total if total else 1), text=f"{label}: {done:,} / {total:,}")
+
+        result = action(progress=on_progress)
+        bar.empty()
+        return result
+
+    result = None
     if st.button("Create Backup Now"):
-        result = create_backup()
-        if isinstance(result, dict):
-            if result.get("success"):
-                st.success(result.get("message"))
-            else:
-                st.error(result.get("message"))
+        result = run_with_progress(get_backup_store().create_snapshot)
+    if st.button("Export Full Backup (.db.zst)"):
+        result = run_with_progress(create_backup)
+
+    if isinstance(result, dict):
+        if result.get("success"):
+            st.success(result.get("message"))
         else:
-            st.success(str(result))
+            st.error(result.get("message"))
+    elif result is not None:
+        st.success(str(result))
 
-    if st.button("⬅ Back to Home"):
-        go_to("home")
+    stats = get_backup_store().stats()
+    st.caption(f"{stats['snapshots']} snapshot(s) · {stats['logical_bytes']:,} bytes logical · "
+               f"{stats['stored_bytes']:,} bytes stored")
 
 # ---------------- RESTORE SCREEN ----------------
 def restore_screen():
     apply_soft_gradient_theme()
     st.header("📂 Restore from Backup")
-    backup_files = os.listdir("backups") if os.path.exists("backups") else []
+    snapshots = get_backup_store().list_snapshots()
+    exports = list_backups()
 
-    if not backup_files:
+    if not snapshots and not exports:
         st.warning("No backups found in the backups/ folder.")
     else:
-        sel = st.selectbox("Choose a backup to restore", options=[""] + backup_files)
+        labels = {s["label"]: s["id"] for s in snapshots}
+        labels.update({f"Exported file: {f}": f for f in exports})
+        sel = st.selectbox("Choose a backup to restore", options=[""] + list(labels))
         if st.button("Restore Selected Backup"):
             if not sel:
                 st.error("Select a backup first.")
             else:
-                result = restore_backup(os.path.join("backups", sel))
+                target = labels[sel]
+                if isinstance(target, int):
+                    result = get_backup_store().restore_snapshot(target)
+                else:
+                    result = restore_backup(os.path.join(BACKUP_DIR, target))
                 if isinstance(result, dict) and result.get("success"):
                     st.success(result.get("message"))
                 else:
@@ -326,7 +501,41 @@ def restore_screen():
 def alerts_screen():
     apply_soft_gradient_theme()
     st.header("🔔 Recent Alerts / Audit Log")
-    logs = execute_sql_query("SELECT * FROM audit_log ORDER BY timestamp DESC LIMIT 10;")
+    flush_audit_log()
+    maybe_archive_alerts()
+    alerts_panel()
+
+    if st.button("⬅ Back to Home"):
+        go_to("home")
+
+@st.fragment
+def alerts_panel():
+    """Filters, new-alert polling and keyset pages; interactions rerun only this panel"""
+    with timed_render("alerts panel"):
+        alerts_panel_body()
+
+def alerts_panel_body():
+    options = get_alert_filter_values()
+    c1, c2, c3 = st.columns(3)
+    user = c1.selectbox("User", [""] + options["user"])
+    action = c2.selectbox("Action", [""] + options["action"])
+    table = c3.selectbox("Table", [""] + options["table_name"])
+    filters = {"user": user or None, "action": action or None, "table": table or None}
+
+    # keyset pagination: a stack of before_id cursors, reset when filters change
+    if st.session_state.get("alerts_filters") != filters:
+        st.session_state["alerts_filters"] = filters
+        st.session_state["alerts_cursors"] = [None]
+    cursors = st.session_state["alerts_cursors"]
+
+    last_seen = st.session_state.get("alerts_last_seen_id")
+    if last_seen is not None:
+        new = poll_alerts(last_seen, **filters)
+        if new.get("rows"):
+            st.info(f"{len(new['rows'])} new alert(s) since your last visit.")
+    st.session_state["alerts_last_seen_id"] = latest_alert_id()
+
+    logs = fetch_alerts(before_id=cursors[-1], **filters)
     if isinstance(logs, dict) and logs.get("rows") is not None:
         rows = logs.get("rows")
         cols = logs.get("columns", [])
@@ -335,30 +544,77 @@ def alerts_screen():
             st.dataframe(df)
         else:
             st.info("No recent alerts found.")
+
+        prev_col, next_col = st.columns(2)
+        if len(cursors) > 1 and prev_col.button("⬅ Newer"):
+            cursors.pop()
+            rerun_panel()
+        if logs.get("next_before_id") and next_col.button("Older ➡"):
+            cursors.append(logs["next_before_id"])
+            rerun_panel()
     else:
         st.error("Unable to fetch audit logs.")
 
+# ---------------- METRICS SCREEN ----------------
+def metrics_screen():
+    apply_soft_gradient_theme()
+    st.header("📈 Metrics")
+    st.markdown("<div class='card'><p class='muted'>Rolling percentiles over the last 1000 samples per stage, for every session in this server process.</p></div>", unsafe_allow_html=True)
+    snapshot = tracer.snapshot()
+
+    latency = snapshot["latency_ms"]
+    if latency:
+        st.subheader("Latency per stage (ms)")
+        st.dataframe(pd.DataFrame.from_dict(latency, orient="index"))
+    else:
+        st.info("No requests traced yet — ask a question first.")
+
+    if snapshot["values"]:
+        st.subheader("Tokens and rows")
+        st.dataframe(pd.DataFrame.from_dict(snapshot["values"], orient="index"))
+
+    traces = list(reversed(snapshot["traces"]))[:10]
+    if traces:
+        st.subheader("Recent requests")
+        st.dataframe(pd.DataFrame([{
+            "request": t["name"],
+            "started": time.strftime("%H:%M:%S", time.localtime(t["start"])),
+            "total_ms": t.get("total_ms"),
+            **t["attrs"],
+            "stages": " · ".join(f"{sp['stage']} {sp['ms']:.1f}" for sp in t["spans"]),
+        } for t in traces]))
+
+    c1, c2, c3 = st.columns(3)
+    c1.download_button("⬇ Prometheus text", tracer.to_prometheus(), file_name="sql_agent_metrics.prom",
+                       mime="text/plain")
+    c2.download_button("⬇ JSON", tracer.to_json(), file_name="sql_agent_metrics.json", mime="application/json")
+    if c3.button("🔄 Refresh"):
+        st.rerun()
+
     if st.button("⬅ Back to Home"):
         go_to("home")
 
 # ---------------- router ----------------
-if st.session_state["page"] == "login":
-    login_screen()
-elif st.session_state["page"] == "otp":
-    otp_screen()
-else:
-    if st.session_state.get("authenticated"):
-        if st.session_state["page"] == "home":
-            home_screen()
-        elif st.session_state["page"] == "ask":
-            ask_screen()
-        elif st.session_state["page"] == "backup":
-            backup_screen()
-        elif st.session_state["page"] == "restore":
-            restore_screen()
-        elif st.session_state["page"] == "alerts":
-            alerts_screen()
-    else:
-        # force login if not authenticated
-        go_to("login")
+with timed_render(f"page {st.session_state['page']}"):
+    if st.session_state["page"] == "login":
         login_screen()
+    elif st.session_state["page"] == "otp":
+        otp_screen()
+    else:
+        if st.session_state.get("authenticated"):
+            if st.session_state["page"] == "home":
+                home_screen()
+            elif st.session_state["page"] == "ask":
+                ask_screen()
+            elif st.session_state["page"] == "backup":
+                backup_screen()
+            elif st.session_state["page"] == "restore":
+                restore_screen()
+            elif st.session_state["page"] == "alerts":
+                alerts_screen()
+            elif st.session_state["page"] == "metrics":
+                metrics_screen()
+        else:
+            # force login if not authenticated
+            go_to("login")
+            login_screen()
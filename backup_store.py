@@ -0,0 +1,284 @@
+import hashlib
+import os
+import time
+import threading
+
+import zstandard as zstd
+
+from utils import (DB_PATH, BACKUP_DIR, BACKUP_PAGES_PER_STEP, BACKUP_ZSTD_LEVEL,
+                   get_pool, online_copy, restore_backup)
+
+# ------------------- CONFIG ------------------- #
+STORE_DIR = os.path.join(BACKUP_DIR, "store")
+CHUNK_SIZE = 64 * 1024                    # page-aligned for page sizes up to 64 KiB
+RETENTION = {"keep_last": 5, "keep_hourly": 24, "keep_daily": 7}
+
+
+# ------------------- CONTENT-ADDRESSED SNAPSHOT STORE ------------------- #
+class BackupStore:
+    """
+    Incremental, deduplicated backups:
+    - each snapshot is an online copy split into CHUNK_SIZE chunks
+    - chunks are stored once, zstd-compressed, named by their SHA-256
+    - an SQLite index lists snapshots and their chunk sequence, so listing
+      and restore never scan the directory
+    - retention (keep last / hourly / daily) + garbage collection of chunks
+    """
+
+    def __init__(self, store_dir=STORE_DIR, chunk_size=CHUNK_SIZE, retention=None):
+        self.store_dir = store_dir
+        self.chunk_dir = os.path.join(store_dir, "chunks")
+        self.chunk_size = chunk_size
+        self.retention = dict(RETENTION if retention is None else retention)
+        self.index_path = os.path.join(store_dir, "index.db")
+        self._lock = threading.Lock()
+        os.makedirs(self.chunk_dir, exist_ok=True)
+
+        with self._index() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    source TEXT,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    new_chunks INTEGER NOT NULL,
+                    new_bytes INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS snapshot_chunks (
+                    snapshot_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    chunk TEXT NOT NULL,
+                    PRIMARY KEY (snapshot_id, seq)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_snapshot_chunks_chunk ON snapshot_chunks(chunk);
+                CREATE TABLE IF NOT EXISTS chunks (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            conn.commit()
+
+    def _index(self):
+        return get_pool(self.index_path).connection()
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunk_dir, digest[:2], digest + ".zst")
+
+    def _write_chunk(self, digest: str, data: bytes, compressor) -> int:
+        path = self._chunk_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = compressor.compress(data)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        return len(payload)
+
+    # ---------------- snapshot ----------------
+    def create_snapshot(self, db_path=DB_PATH, progress=None, pages=BACKUP_PAGES_PER_STEP) -> dict:
+        """Snapshot the live DB; only chunks not already in the store are written"""
+        tmp_file = os.path.join(self.store_dir, f"snapshot_{time.time_ns()}.tmp")
+        try:
+            online_copy(db_path, tmp_file, progress, pages)
+            size = os.path.getsize(tmp_file)
+
+            with self._index() as conn:
+                known = {r[0] for r in conn.execute("SELECT hash FROM chunks;")}
+
+            compressor = zstd.ZstdCompressor(level=BACKUP_ZSTD_LEVEL)
+            file_sha = hashlib.sha256()
+            sequence, new_chunks = [], []
+            new_bytes = done = 0
+            with open(tmp_file, "rb") as f:
+                for data in iter(lambda: f.read(self.chunk_size), b""):
+                    file_sha.update(data)
+                    digest = hashlib.sha256(data).hexdigest()
+                    sequence.append(digest)
+                    if digest not in known:
+                        stored = self._write_chunk(digest, data, compressor)
+                        known.add(digest)
+                        new_chunks.append((digest, len(data), stored))
+                        new_bytes += stored
+                    done += len(data)
+                    if progress:
+                        progress("chunk", done, size)
+
+            with self._lock, self._index() as conn:
+                conn.executemany("INSERT OR IGNORE INTO chunks (hash, size, stored_size) VALUES (?, ?, ?)",
+                                 new_chunks)
+                # gc may have dropped a chunk deduplicated above since `known` was read
+                new_bytes += self._restore_missing(conn, tmp_file, sequence, new_chunks, compressor)
+                cur = conn.execute("""
+                    INSERT INTO snapshots (created_at, source, size, sha256, chunk_size,
+                                           chunk_count, new_chunks, new_bytes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (time.time(), os.path.abspath(db_path), size, file_sha.hexdigest(),
+                      self.chunk_size, len(sequence), len(new_chunks), new_bytes))
+                snapshot_id = cur.lastrowid
+                conn.executemany("INSERT INTO snapshot_chunks (snapshot_id, seq, chunk) VALUES (?, ?, ?)",
+                                 [(snapshot_id, i, d) for i, d in enumerate(sequence)])
+                conn.commit()
+
+            pruned = self.apply_retention()
+            return {
+                "success": True,
+                "message": (f"Snapshot #{snapshot_id} created: {len(new_chunks)}/{len(sequence)} "
+                            f"new chunks, {new_bytes:,} bytes written"
+                            + (f", {pruned['snapshots']} old snapshot(s) pruned" if pruned["snapshots"] else "")),
+                "snapshot_id": snapshot_id,
+            }
+        except Exception as e:
+            return {"success": False, "message": f"Snapshot failed: {e}"}
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _restore_missing(self, conn, tmp_file, sequence, new_chunks, compressor) -> int:
+        """Rewrite (from tmp_file) chunks of `sequence` missing from the index or disk; bytes written"""
+        present = {r[0] for r in conn.execute("SELECT hash FROM chunks;")}
+        written = {d for d, _, _ in new_chunks}
+        checked, total = set(), 0
+        with open(tmp_file, "rb") as f:
+            for seq, digest in enumerate(sequence):
+                if digest in checked:
+                    continue
+                checked.add(digest)
+                if digest in present and os.path.exists(self._chunk_path(digest)):
+                    continue
+                f.seek(seq * self.chunk_size)
+                data = f.read(self.chunk_size)
+                stored = self._write_chunk(digest, data, compressor)
+                conn.execute("INSERT OR REPLACE INTO chunks (hash, size, stored_size) VALUES (?, ?, ?)",
+                             (digest, len(data), stored))
+                if digest not in written:
+                    new_chunks.append((digest, len(data), stored))
+                total += stored
+        return total
+
+    def list_snapshots(self) -> list:
+        """Snapshots from the index, newest first"""
+        with self._index() as conn:
+            rows = conn.execute("""
+                SELECT id, created_at, size, chunk_count, new_chunks, new_bytes
+                FROM snapshots ORDER BY id DESC;
+            """).fetchall()
+        return [
+            {"id": r[0], "created_at": r[1], "size": r[2], "chunks": r[3],
+             "new_chunks": r[4], "new_bytes": r[5],
+             "label": f"#{r[0]} — {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r[1]))} ({r[2]:,} bytes)"}
+            for r in rows
+        ]
+
+    # ---------------- restore ----------------
+    def reconstruct(self, snapshot_id: int, target_file: str):
+        """Write the snapshot's DB file to `target_file`, verifying its checksum"""
+        with self._index() as conn:
+            snap = conn.execute("SELECT sha256 FROM snapshots WHERE id = ?;", (snapshot_id,)).fetchone()
+            if snap is None:
+                raise ValueError(f"snapshot #{snapshot_id} not found")
+            sequence = [r[0] for r in conn.execute(
+                "SELECT chunk FROM snapshot_chunks WHERE snapshot_id = ? ORDER BY seq;", (snapshot_id,))]
+
+        decompressor = zstd.ZstdDecompressor()
+        file_sha = hashlib.sha256()
+        with open(target_file, "wb") as out:
+            for digest in sequence:
+                with open(self._chunk_path(digest), "rb") as f:
+                    data = decompressor.decompress(f.read())
+                file_sha.update(data)
+                out.write(data)
+
+        if file_sha.hexdigest() != snap[0]:
+            os.remove(target_file)
+            raise ValueError(f"snapshot #{snapshot_id} failed checksum verification")
+
+    def restore_snapshot(self, snapshot_id: int, db_path=None) -> dict:
+        """Restore a snapshot over `db_path` (default: the database it was taken from)"""
+        tmp_file = os.path.join(self.store_dir, f"restore_{snapshot_id}_{time.time_ns()}.db")
+        start = time.perf_counter()
+        try:
+            if db_path is None:
+                with self._index() as conn:
+                    row = conn.execute("SELECT source FROM snapshots WHERE id = ?;", (snapshot_id,)).fetchone()
+                db_path = row[0] if row else None
+            self.reconstruct(snapshot_id, tmp_file)
+            result = restore_backup(tmp_file, db_path)
+            if result.get("success"):
+                elapsed = time.perf_counter() - start
+                result["elapsed_ms"] = round(elapsed * 1000, 2)
+                result["message"] = f"Database restored from snapshot #{snapshot_id} in {elapsed:.2f}s"
+            return result
+        except Exception as e:
+            return {"success": False, "message": f"Restore failed: {e}"}
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    # ---------------- retention ----------------
+    def _snapshots_to_keep(self, snapshots) -> set:
+        """snapshots = [(id, created_at)] newest first"""
+        keep = {sid for sid, _ in snapshots[:self.retention.get("keep_last", 0)]}
+        for bucket_fmt, limit in (("%Y%m%d%H", self.retention.get("keep_hourly", 0)),
+                                  ("%Y%m%d", self.retention.get("keep_daily", 0))):
+            seen = set()
+            for sid, created_at in snapshots:
+                bucket = time.strftime(bucket_fmt, time.localtime(created_at))
+                if bucket in seen:
+                    continue
+                if len(seen) >= limit:
+                    break
+                seen.add(bucket)
+                keep.add(sid)       # newest snapshot of each hour / day
+        return keep
+
+    def apply_retention(self) -> dict:
+        """Drop snapshots outside the retention policy, then garbage-collect chunks"""
+        with self._lock, self._index() as conn:
+            snapshots = conn.execute("SELECT id, created_at FROM snapshots ORDER BY id DESC;").fetchall()
+            keep = self._snapshots_to_keep(snapshots)
+            drop = [(sid,) for sid, _ in snapshots if sid not in keep]
+            if drop:
+                conn.executemany("DELETE FROM snapshot_chunks WHERE snapshot_id = ?;", drop)
+                conn.executemany("DELETE FROM snapshots WHERE id = ?;", drop)
+                conn.commit()
+        removed = self.gc() if drop else {"chunks": 0, "bytes": 0}
+        return {"snapshots": len(drop), **removed}
+
+    def gc(self) -> dict:
+        """Delete chunks no snapshot references"""
+        with self._lock, self._index() as conn:
+            orphans = conn.execute("""
+                SELECT hash, stored_size FROM chunks
+                WHERE NOT EXISTS (SELECT 1 FROM snapshot_chunks sc WHERE sc.chunk = chunks.hash);
+            """).fetchall()
+            conn.executemany("DELETE FROM chunks WHERE hash = ?;", [(h,) for h, _ in orphans])
+            conn.commit()
+            # under the lock, so a snapshot being committed never loses a chunk it checked
+            for digest, _ in orphans:
+                try:
+                    os.remove(self._chunk_path(digest))
+                except FileNotFoundError:
+                    pass
+        return {"chunks": len(orphans), "bytes": sum(size for _, size in orphans)}
+
+    def stats(self) -> dict:
+        with self._index() as conn:
+            snapshots, logical = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM snapshots;").fetchone()
+            chunks, stored = conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM chunks;").fetchone()
+        return {"snapshots": snapshots, "logical_bytes": logical, "chunks": chunks, "stored_bytes": stored}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_backup_store() -> BackupStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BackupStore()
+        return _store
@@ -0,0 +1,287 @@
+# batch.py — headless batch mode: translate and run a JSONL file of questions
+#
+#   python batch.py questions.jsonl --out results.jsonl
+#   python batch.py questions.jsonl --out results.parquet --concurrency 16 --db-workers 4
+#   python batch.py requests.jsonl --id-field request_id --question-field title --no-execute
+#
+# Input: one JSON object per line ({"id": ..., "question": ...}) or a bare JSON string.
+# Output is written as items finish; a checkpoint file lists finished ids so an
+# interrupted run picks up where it stopped (pass --fresh to start over).
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import DB_PATH, POOL_MAX_CONNECTIONS, get_pool, flush_audit_log
+
+# ------------------- CONFIG ------------------- #
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))     # LLM calls in flight
+BATCH_DB_WORKERS = min(4, POOL_MAX_CONNECTIONS)                    # read connections in use
+BATCH_MAX_ROWS = 1000                     # result rows kept per question
+PARQUET_PART_ROWS = 200                   # items per Parquet part file
+
+
+# ------------------- INPUT ------------------- #
+def read_questions(path, id_field="id", question_field="question"):
+    """Yield (item_id, question, item) per line without loading the whole file"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {question_field: item}
+            item_id = item.get(id_field)
+            yield str(item_id if item_id is not None else f"line-{line_no}"), item.get(question_field), item
+
+
+# ------------------- CHECKPOINT ------------------- #
+class Checkpoint:
+    """Append-only list of finished item ids (one per line)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def mark(self, item_ids):
+        for item_id in item_ids:
+            self._file.write(f"{item_id}\n")
+            self.done.add(item_id)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# ------------------- OUTPUT ------------------- #
+class JsonlWriter:
+    """One JSON record per line, flushed (and checkpointed) per item"""
+
+    def __init__(self, path, checkpoint):
+        self.checkpoint = checkpoint
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.checkpoint.mark([record["id"]])
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Parquet dataset directory: every PARQUET_PART_ROWS items become one
+    part file, written atomically, then checkpointed. A part is complete
+    or absent, so an interrupted run never leaves a truncated file.
+    Read it back with pandas.read_parquet(path).
+    """
+
+    def __init__(self, path, checkpoint, part_rows=PARQUET_PART_ROWS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.checkpoint = checkpoint
+        self.part_rows = part_rows
+        self._pending = []
+        self._schema = pa.schema(
+            [(name, pa.string()) for name in ("id", "question", "sql", "status", "error")]
+            + [("row_count", pa.int64()), ("truncated", pa.bool_())]
+            + [(name, pa.float64()) for name in ("generate_ms", "execute_ms", "total_ms")]
+            + [("cached", pa.bool_()), ("template", pa.string()), ("columns", pa.string()), ("rows", pa.string())]
+        )
+        os.makedirs(path, exist_ok=True)
+        self._part = len([n for n in os.listdir(path) if n.endswith(".parquet")])
+
+    def write(self, record):
+        timings = record["timings"]
+        self._pending.append({
+            **{k: record[k] for k in ("id", "question", "sql", "status", "error", "row_count", "truncated")},
+            **{k: timings.get(k) for k in ("generate_ms", "execute_ms", "total_ms", "cached")},
+            "template": (timings.get("template") or {}).get("template"),
+            "columns": json.dumps(record["columns"]),
+            "rows": json.dumps(record["rows"], default=str),
+        })
+        if len(self._pending) >= self.part_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        table = self._pa.Table.from_pylist(self._pending, schema=self._schema)
+        target = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        self._pq.write_table(table, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self._part += 1
+        self.checkpoint.mark([r["id"] for r in self._pending])
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+
+def open_writer(path, checkpoint):
+    return ParquetWriter(path, checkpoint) if path.endswith(".parquet") else JsonlWriter(path, checkpoint)
+
+
+# ------------------- RUN ------------------- #
+def execute_read_only(llm_sql, sql_query, user, max_rows):
+    """llm_sql.execute on a pooled connection with PRAGMA query_only (writes are refused)"""
+    with get_pool(DB_PATH).connection() as conn:   # nested calls in this thread reuse it
+        conn.execute("PRAGMA query_only=ON;")
+        try:
+            return llm_sql.execute(sql_query, user=user, page_size=max_rows)
+        finally:
+            conn.execute("PRAGMA query_only=OFF;")
+
+
+async def run_item(llm_sql, item_id, question, execute, executor, user, max_rows) -> dict:
+    """Translate + execute one question; failures are recorded, never raised"""
+    start = time.perf_counter()
+    record = {"id": item_id, "question": question, "sql": None, "status": "ok", "error": None,
+              "columns": [], "rows": [], "row_count": 0, "truncated": False, "timings": {}}
+    try:
+        if not question:
+            raise ValueError("missing question")
+        generated = await llm_sql.agenerate(question)
+        result = None
+        if generated["sql"] is not None and execute:
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, execute_read_only, llm_sql, generated["sql"], user, max_rows)
+        response = llm_sql.respond(generated, result)
+        results = response["results"] or {}
+        record.update(sql=response["sql"], timings=response["timings"],
+                      columns=results.get("columns", []), rows=results.get("rows", []),
+                      truncated=bool(results.get("has_next")))
+        if results.get("error"):
+            record.update(status="error", error=results["error"])
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["row_count"] = len(record["rows"])
+    record["timings"]["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return record
+
+
+async def run_batch_file(input_path, output_path, checkpoint_path=None, concurrency=BATCH_CONCURRENCY,
+                         db_workers=BATCH_DB_WORKERS, execute=True, user="batch", max_rows=BATCH_MAX_ROWS,
+                         id_field="id", question_field="question", progress=None) -> dict:
+    """
+    Stream questions from `input_path` through `concurrency` workers
+    (at most that many LLM calls in flight) with SQL executed on
+    `db_workers` read-only pooled connections. Finished items are skipped.
+    """
+    from rag_model import llm_sql, get_async_groq, close_async_groq
+
+    checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint")
+    writer = open_writer(output_path, checkpoint)
+    executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="batch-sql")
+    queue = asyncio.Queue(maxsize=concurrency * 2)        # bounded read-ahead
+    summary = {"ok": 0, "error": 0, "skipped": 0}
+    totals = []
+
+    async def worker():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            record = await run_item(llm_sql, *entry, execute, executor, user, max_rows)
+            writer.write(record)
+            summary[record["status"]] += 1
+            totals.append(record["timings"]["total_ms"])
+            if progress:
+                progress(record)
+
+    start = time.perf_counter()
+    get_async_groq(concurrency)
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+
+    async def feed():
+        seen = set()
+        for item_id, question, _ in read_questions(input_path, id_field, question_field):
+            if item_id in checkpoint.done or item_id in seen:
+                summary["skipped"] += 1
+                continue
+            seen.add(item_id)
+            await queue.put((item_id, question))
+        for _ in workers:
+            await queue.put(None)
+
+    try:
+        await asyncio.gather(feed(), *workers)     # a failing writer stops the whole run
+    finally:
+        for task in workers:
+            task.cancel()
+        writer.close()
+        checkpoint.close()
+        executor.shutdown(wait=True)
+        flush_audit_log()
+        await close_async_groq()
+
+    elapsed = time.perf_counter() - start
+    done = summary["ok"] + summary["error"]
+    summary.update({
+        "elapsed_s": round(elapsed, 2),
+        "items_per_s": round(done / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(totals), 2) if totals else None,
+        "p95_ms": round(sorted(totals)[min(len(totals) - 1, int(len(totals) * 0.95))], 2) if totals else None,
+    })
+    return summary
+
+
+def main(args) -> int:
+    output = args.out
+    checkpoint_path = args.checkpoint or output + ".checkpoint"
+    if args.fresh:
+        for path in (output, checkpoint_path):
+            if os.path.isdir(path):
+                for name in os.listdir(path):
+                    if name.endswith((".parquet", ".tmp")):
+                        os.remove(os.path.join(path, name))
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def progress(record):
+        if not args.quiet:
+            print(f"[{record['status']:>5}] {record['id']} "
+                  f"({record['timings']['total_ms']:.0f} ms, {record['row_count']} rows)", flush=True)
+
+    try:
+        summary = asyncio.run(run_batch_file(
+            args.input, output, checkpoint_path, concurrency=args.concurrency, db_workers=args.db_workers,
+            execute=not args.no_execute, user=args.user, max_rows=args.max_rows,
+            id_field=args.id_field, question_field=args.question_field, progress=progress))
+    except KeyboardInterrupt:
+        print(f"Interrupted; finished items are in {checkpoint_path}, rerun the same command to resume")
+        return 130
+    print(json.dumps(summary))
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Translate and run a JSONL file of questions")
+    parser.add_argument("input", help="JSONL file: {\"id\": ..., \"question\": ...} per line")
+    parser.add_argument("--out", default="batch_results.jsonl", help=".jsonl file or .parquet dataset directory")
+    parser.add_argument("--checkpoint", default=None, help="finished-id file (default: <out>.checkpoint)")
+    parser.add_argument("--fresh", action="store_true", help="discard the checkpoint and previous output")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--db-workers", type=int, default=BATCH_DB_WORKERS, help="read connections used")
+    parser.add_argument("--max-rows", type=int, default=BATCH_MAX_ROWS, help="result rows kept per question")
+    parser.add_argument("--no-execute", action="store_true", help="only translate to SQL")
+    parser.add_argument("--user", default="batch")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--quiet", action="store_true")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,241 @@
+# benchmarks.py — microbenchmarks for the utils / rag_model hot paths
+#
+#   python benchmarks.py run --scales 1 10 100 --out base.json
+#   python benchmarks.py run --scales 1 10 100 --out new.json
+#   python benchmarks.py compare base.json new.json --threshold 0.10
+#
+# No network needed: the Groq call goes to llm_stub.StubLLMServer.
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import sqlite3
+import statistics
+import tempfile
+
+from llm_stub import StubLLMServer
+
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_SEED = 42
+
+SAMPLE_LLM_OUTPUTS = {
+    "fenced": "Here is the query:\n```sql\nSELECT first_name, salary FROM employees WHERE salary > 50000;\n```\n"
+              "It returns every employee earning more than 50000.",
+    "bare": "SELECT c.client_name, SUM(i.amount) FROM clients c JOIN invoices i ON i.client_id = c.client_id "
+            "GROUP BY c.client_name ORDER BY 2 DESC;",
+}
+SAMPLE_QUESTIONS = [
+    "show mobile numbr of staff in dept HR",
+    "give me earning of every worker hired after 2021",
+    "customer phon no for overdue invoices",
+    "list projcts and the assignment roles",
+]
+
+
+# ---------------- timing ----------------
+def measure(fn, iterations: int, warmup: int = 3) -> dict:
+    """Run fn() `iterations` times; per-call stats in microseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "min_us": round(samples[0], 2),
+        "median_us": round(statistics.median(samples), 2),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "mean_us": round(statistics.fmean(samples), 2),
+        "ops_per_s": round(1e6 / statistics.fmean(samples), 1),
+    }
+
+
+# ---------------- benchmark cases ----------------
+def build_cases(db_path: str, modules: dict, stub_url: str) -> dict:
+    """name -> zero-argument callable exercising one hot path on db_path"""
+    utils = modules["utils"]
+    rag_model = modules["rag_model"]
+    prompt_builder = modules["prompt_builder"]
+    pd = modules["pandas"]
+
+    with sqlite3.connect(db_path) as conn:
+        max_employee = conn.execute("SELECT MAX(employee_id) FROM employees").fetchone()[0]
+    counter = {"i": 0}
+
+    def next_id():
+        counter["i"] = counter["i"] % max_employee + 1
+        return counter["i"]
+
+    select_sql = ("SELECT d.department_name, COUNT(*), AVG(e.salary) FROM employees e "
+                  "JOIN departments d ON d.department_id = e.department_id GROUP BY d.department_name")
+    frame_result = utils.execute_sql_query("SELECT * FROM employees", db_path=db_path, max_rows=1000)
+
+    def select_cold():
+        utils.result_cache.clear()
+        utils.execute_sql_query(select_sql, db_path=db_path)
+
+    def select_cached():
+        utils.execute_sql_query(select_sql, db_path=db_path)
+
+    def dml_update():
+        utils.execute_sql_query(
+            f"UPDATE employees SET salary = salary WHERE employee_id = {next_id()}",
+            db_path=db_path, user="bench")
+
+    def error_suggestion():
+        utils.execute_sql_query("SELECT salry, frist_name FROM employes", db_path=db_path)
+
+    def audit_write():
+        utils.log_db_action("bench", "UPDATE", "employees", str(next_id()), "benchmark", db_path=db_path)
+
+    def normalize():
+        for q in SAMPLE_QUESTIONS:
+            rag_model.normalize_query(q)
+
+    def extract():
+        for text in SAMPLE_LLM_OUTPUTS.values():
+            utils.extract_sql_from_llm(text)
+
+    def prompt_format():
+        for q in SAMPLE_QUESTIONS:
+            prompt_builder.build_sql_prompt(rag_model.SQL_PROMPT, q, db_path=db_path)
+
+    def dataframe():
+        pd.DataFrame(frame_result["rows"], columns=frame_result["columns"])
+
+    def pipeline_stub():
+        question = rag_model.normalize_query(SAMPLE_QUESTIONS[0])
+        prompt = prompt_builder.build_sql_prompt(rag_model.SQL_PROMPT, question, db_path=db_path)
+        response = rag_model.groq_client.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": prompt}], timeout=30)
+        sql = utils.extract_sql_from_llm(response.choices[0].message.content)
+        utils.result_cache.clear()
+        result = utils.execute_sql_query(sql, db_path=db_path)
+        pd.DataFrame(result["rows"], columns=result["columns"])
+
+    return {
+        "execute_select_cold": select_cold,
+        "execute_select_cached": select_cached,
+        "execute_dml_update": dml_update,
+        "execute_error_suggestions": error_suggestion,
+        "log_db_action": audit_write,
+        "normalize_query_x4": normalize,
+        "extract_sql_from_llm_x2": extract,
+        "build_sql_prompt_x4": prompt_format,
+        "dataframe_1000_rows": dataframe,
+        "pipeline_with_stub_llm": pipeline_stub,
+    }
+
+
+def load_modules(workdir: str, stub_url: str) -> dict:
+    """Import the app modules against the stub LLM and scratch cache files"""
+    os.environ["GROQ_BASE_URL"] = stub_url
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    os.environ["TRANSLATION_CACHE_PATH"] = os.path.join(workdir, "translation_cache.db")
+    import pandas
+    import utils
+    import rag_model
+    import prompt_builder
+    return {"utils": utils, "rag_model": rag_model, "prompt_builder": prompt_builder, "pandas": pandas}
+
+
+def ensure_database(data_dir: str, scale: float, seed: int) -> str:
+    from create_db import create_company_db
+    path = os.path.join(data_dir, f"bench_scale{scale:g}_seed{seed}.db")
+    if not os.path.exists(path):
+        create_company_db(path, scale=scale, seed=seed)
+    return path
+
+
+def run(args) -> dict:
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(data_dir, exist_ok=True)
+
+    with StubLLMServer() as stub:
+        modules = load_modules(data_dir, stub.base_url)
+        report = {
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "iterations": args.iterations,
+            },
+            "results": {},
+        }
+        for scale in args.scales:
+            db_path = ensure_database(data_dir, scale, args.seed)
+            cases = build_cases(db_path, modules, stub.base_url)
+            scale_results = {}
+            for name, fn in cases.items():
+                if args.only and not any(o in name for o in args.only):
+                    continue
+                scale_results[name] = measure(fn, args.iterations)
+                print(f"scale={scale:<6g} {name:<28} median {scale_results[name]['median_us']:>10.1f} us")
+            report["results"][f"{scale:g}"] = scale_results
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+    return report
+
+
+# ---------------- comparison ----------------
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """Rows of (scale, bench, base median, new median, change, flag)"""
+    rows = []
+    for scale, benches in new["results"].items():
+        for name, stats in benches.items():
+            before = base["results"].get(scale, {}).get(name)
+            if not before:
+                continue
+            change = (stats["median_us"] - before["median_us"]) / before["median_us"]
+            flag = "REGRESSION" if change > threshold else ("improved" if change < -threshold else "")
+            rows.append((scale, name, before["median_us"], stats["median_us"], change, flag))
+    return rows
+
+
+def run_compare(args) -> int:
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows = compare(base, new, args.threshold)
+    print(f"{'scale':<7}{'benchmark':<30}{'base us':>12}{'new us':>12}{'change':>10}")
+    for scale, name, before, after, change, flag in rows:
+        print(f"{scale:<7}{name:<30}{before:>12.1f}{after:>12.1f}{change:>+10.1%}  {flag}")
+
+    regressions = [r for r in rows if r[5] == "REGRESSION"]
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the SQL agent hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="run the benchmarks and write JSON results")
+    p_run.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES)
+    p_run.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    p_run.add_argument("--iterations", type=int, default=200)
+    p_run.add_argument("--data-dir", default=None, help="where generated DBs are kept (reused if present)")
+    p_run.add_argument("--only", nargs="*", help="run benchmarks whose name contains one of these")
+    p_run.add_argument("--out", default="bench_results.json")
+
+    p_cmp = sub.add_parser("compare", help="compare two result files and flag regressions")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(run_compare(args))
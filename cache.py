@@ -0,0 +1,199 @@
+import sqlite3
+import hashlib
+import re
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# ------------------- CONFIG ------------------- #
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", "translation_cache.db")
+TRANSLATION_CACHE_TTL = 24 * 60 * 60     # seconds
+TRANSLATION_CACHE_MAX_ENTRIES = 1000
+
+
+# ------------------- NL -> SQL TRANSLATION CACHE ------------------- #
+class TranslationCache:
+    """
+    Disk-backed cache of generated SQL:
+    - Key = normalized question + schema fingerprint + model
+    - LRU eviction above `max_entries`, entries expire after `ttl`
+    - Entries for an old schema never match and are purged on write
+    """
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH, ttl=TRANSLATION_CACHE_TTL,
+                 max_entries=TRANSLATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                question TEXT,
+                sql TEXT NOT NULL,
+                schema_fp TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question: str, schema_fp: str, model: str = "") -> str:
+        q = re.sub(r"\s+", " ", question).strip().lower()
+        return hashlib.sha256(f"{model}\x00{schema_fp}\x00{q}".encode()).hexdigest()
+
+    def get(self, question: str, schema_fp: str, model: str = ""):
+        """Cached SQL for the question, or None"""
+        key = self.make_key(question, schema_fp, model)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql, created_at FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, question: str, schema_fp: str, sql: str, model: str = ""):
+        key = self.make_key(question, schema_fp, model)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM translations WHERE schema_fp != ? OR created_at < ?",
+                               (schema_fp, now - self.ttl))
+            self._conn.execute("""
+                INSERT OR REPLACE INTO translations (key, question, sql, schema_fp, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, question, sql, schema_fp, now, now))
+            self._conn.execute("""
+                DELETE FROM translations WHERE key IN (
+                    SELECT key FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM translations")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+
+# ------------------- SELECT RESULT CACHE ------------------- #
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+def estimate_result_size(columns, rows) -> int:
+    """Rough in-memory size of a result set in bytes"""
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(c) for c in columns)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+class ResultCache:
+    """
+    In-memory cache of SELECT results:
+    - Each entry remembers the tables the statement reads
+    - A write to any of those tables evicts the entry
+    - LRU eviction once the estimated size exceeds `max_bytes`
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()     # key -> (columns, rows, tables, size)
+        self._by_table = {}               # (db, table) -> set(keys)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0               # bumped on every invalidation
+
+    def get(self, db_path: str, query: str):
+        """(columns, rows) or None"""
+        key = (db_path, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, db_path: str, query: str, columns, rows, tables, generation=None):
+        """Store a result; skipped if a write invalidated anything since `generation`"""
+        size = estimate_result_size(columns, rows)
+        if size > self.max_bytes // 4:
+            return
+        key = (db_path, query)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(key)
+            rows = tuple(rows)
+            tables = frozenset(t.lower() for t in tables)
+            self._entries[key] = (columns, rows, tables, size)
+            self._bytes += size
+            for t in tables:
+                self._by_table.setdefault((db_path, t), set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[3]
+        for t in entry[2]:
+            keys = self._by_table.get((key[0], t))
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[(key[0], t)]
+
+    def invalidate_tables(self, db_path: str, tables):
+        """Evict every entry that reads one of `tables`"""
+        with self._lock:
+            self.generation += 1
+            for t in tables:
+                for key in list(self._by_table.get((db_path, t.lower()), ())):
+                    self._remove(key)
+
+    def clear(self, db_path: str = None):
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if db_path is None or k[0] == db_path]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
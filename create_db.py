@@ -1,19 +1,182 @@
 # create_db.py
+#
+#   python create_db.py                                   # demo-sized DB
+#   python create_db.py --scale 5000 --seed 42            # ~1M employees
+#   python create_db.py --scale 5000 --count invoices=10000000 --workers 8
 import os
+import sys
+import time
 import sqlite3
 import random
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
 from faker import Faker
 from pathlib import Path
 from dotenv import load_dotenv
+from index_advisor import create_baseline_indexes
 
-fake = Faker()
 load_dotenv()
 
 DB_PATH = os.getenv("DB_PATH", "./company.db")
 
-def create_company_db():
-    Path(os.path.dirname(DB_PATH)).mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+# Row counts at scale 1 (departments are a fixed list)
+DEPARTMENTS = ["HR", "Sales", "IT", "Finance", "R&D", "Marketing"]
+BASE_COUNTS = {
+    "employees": 200,
+    "projects": 30,
+    "employee_projects": 500,
+    "clients": 50,
+    "invoices": 200,
+}
+TABLE_ORDER = ["employees", "projects", "employee_projects", "clients", "invoices"]
+BATCH_SIZE = 10000              # rows generated per task / executemany call
+COMMIT_ROWS = 500000            # rows per load transaction
+INLINE_MAX_ROWS = 50000         # smaller loads are generated in-process (pool startup costs more)
+ROLES = ["Developer", "Manager", "Tester", "Analyst"]
+STATUSES = ["Paid", "Pending", "Overdue"]
+DATE_START = date(2020, 1, 1)
+DATE_DAYS = 6 * 365
+
+INSERT_SQL = {
+    "departments": "INSERT INTO departments (department_id, department_name, location_id) VALUES (?, ?, ?)",
+    "employees": """INSERT INTO employees (employee_id, first_name, last_name, email, phone_number,
+                    hire_date, job_id, salary, department_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "projects": "INSERT INTO projects (project_id, project_name, start_date, end_date, department_id) VALUES (?, ?, ?, ?, ?)",
+    "employee_projects": "INSERT INTO employee_projects (employee_id, project_id, role) VALUES (?, ?, ?)",
+    "clients": "INSERT INTO clients (client_id, client_name, contact_email, contact_phone) VALUES (?, ?, ?, ?)",
+    "invoices": "INSERT INTO invoices (invoice_id, client_id, amount, invoice_date, status) VALUES (?, ?, ?, ?, ?)",
+}
+
+
+# ---------------- row generation (runs in worker processes) ----------------
+VOCABULARY_SIZE = 1000          # distinct Faker values sampled per field
+_vocabularies = {}
+
+
+def _vocabulary(seed: int) -> dict:
+    """
+    Faker values drawn once per seed; rows combine them with a seeded RNG,
+    which is ~50x faster than calling Faker for every row.
+    """
+    if seed not in _vocabularies:
+        fake = Faker()
+        fake.seed_instance(seed)
+        n = VOCABULARY_SIZE
+        _vocabularies[seed] = {
+            "first_names": [fake.first_name() for _ in range(n)],
+            "last_names": [fake.last_name() for _ in range(n)],
+            "jobs": [fake.job() for _ in range(n // 2)],
+            "projects": [fake.bs().title() for _ in range(n)],
+            "companies": [fake.company() for _ in range(n)],
+            "domains": [fake.free_email_domain() for _ in range(20)] + [fake.domain_name() for _ in range(80)],
+            "cities": [fake.city() for _ in range(len(DEPARTMENTS))],
+        }
+    return _vocabularies[seed]
+
+
+def _chunk_rng(seed: int, table: str, chunk: int):
+    """RNG seeded from (seed, table, chunk) so any chunk is reproducible on its own"""
+    return random.Random((seed * 1000003 + (TABLE_ORDER.index(table) + 1) * 100003 + chunk) & 0xFFFFFFFF)
+
+
+def _random_date(rng) -> str:
+    return (DATE_START + timedelta(days=rng.randrange(DATE_DAYS))).isoformat()
+
+
+def _random_phone(rng) -> str:
+    return f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+
+
+def _email(rng, vocab, local: str) -> str:
+    return f"{local.lower().replace(' ', '')}{rng.randint(1, 999)}@{rng.choice(vocab['domains'])}"
+
+
+def _generate_chunk(task):
+    """task = (table, seed, chunk, first_id, n_rows, counts) -> (table, rows)"""
+    table, seed, chunk, first_id, n_rows, counts = task
+    rng = _chunk_rng(seed, table, chunk)
+    vocab = _vocabulary(seed)
+    ids = range(first_id, first_id + n_rows)
+    n_depts = len(DEPARTMENTS)
+
+    if table == "employees":
+        rows = []
+        for i in ids:
+            first, last = rng.choice(vocab["first_names"]), rng.choice(vocab["last_names"])
+            rows.append((i, first, last, _email(rng, vocab, f"{first}.{last}"), _random_phone(rng),
+                         _random_date(rng), rng.choice(vocab["jobs"]), round(rng.uniform(40000, 120000), 2),
+                         rng.randint(1, n_depts)))
+    elif table == "projects":
+        rows = [(i, rng.choice(vocab["projects"]), _random_date(rng), _random_date(rng), rng.randint(1, n_depts))
+                for i in ids]
+    elif table == "employee_projects":
+        rows = [(rng.randint(1, counts["employees"]), rng.randint(1, counts["projects"]), rng.choice(ROLES))
+                for _ in ids]
+    elif table == "clients":
+        rows = []
+        for i in ids:
+            company = rng.choice(vocab["companies"])
+            rows.append((i, company, _email(rng, vocab, company.split()[0].strip(",")), _random_phone(rng)))
+    else:
+        rows = [(i, rng.randint(1, counts["clients"]), round(rng.uniform(1000, 50000), 2),
+                 _random_date(rng), rng.choice(STATUSES)) for i in ids]
+    return table, rows
+
+
+def _load_tasks(counts: dict, seed: int, batch_size: int):
+    for table in TABLE_ORDER:
+        for chunk, first in enumerate(range(0, counts[table], batch_size)):
+            yield (table, seed, chunk, first + 1, min(batch_size, counts[table] - first), counts)
+
+
+def _generate_all(tasks, workers: int):
+    """Generated chunks in task order, at most 2*workers in flight"""
+    if workers <= 1:
+        for task in tasks:
+            yield _generate_chunk(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = iter(tasks)
+        pending = deque(pool.submit(_generate_chunk, t) for t in itertools.islice(tasks, workers * 2))
+        while pending:
+            result = pending.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(pool.submit(_generate_chunk, task))
+            yield result
+
+
+def scaled_counts(scale: float = 1, overrides: dict = None) -> dict:
+    counts = {t: max(1, int(n * scale)) for t, n in BASE_COUNTS.items()}
+    counts.update(overrides or {})
+    return counts
+
+
+# ---------------- database ----------------
+def create_company_db(db_path=None, scale: float = 1, seed: int = None, workers: int = None,
+                      counts: dict = None, batch_size: int = BATCH_SIZE):
+    """
+    (Re)create the company DB with generated data.
+    - `scale` multiplies BASE_COUNTS, `counts` overrides single tables
+    - same `seed` -> identical data; rows are generated in `workers` processes
+      (in-process for one chunk or up to INLINE_MAX_ROWS rows)
+    - bulk load with journaling off, indexes built after the load
+    """
+    db_path = db_path or DB_PATH
+    counts = scaled_counts(scale, counts)
+    seed = random.randrange(2 ** 31) if seed is None else seed
+    n_tasks = sum(-(-n // batch_size) for n in counts.values())
+    workers = min(workers or os.cpu_count() or 1, n_tasks)
+    if sum(counts.values()) <= INLINE_MAX_ROWS:
+        workers = 1
+    started = time.perf_counter()
+
+    Path(os.path.dirname(db_path) or ".").mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Drop tables if exist
@@ -26,6 +189,7 @@ def create_company_db():
     DROP TABLE IF EXISTS clients;
     DROP TABLE IF EXISTS invoices;
     DROP TABLE IF EXISTS audit_log;
+    DROP TABLE IF EXISTS audit_log_archive;
     """)
 
     # Create tables
@@ -102,53 +266,58 @@ def create_company_db():
     );
     """)
 
-    # Insert sample departments
-    dept_ids = []
-    for d in ["HR", "Sales", "IT", "Finance", "R&D", "Marketing"]:
-        cursor.execute("INSERT INTO departments (department_name, location_id) VALUES (?, ?)", 
-                       (d, fake.city()))
-        dept_ids.append(cursor.lastrowid)
-
-    # Insert sample employees
-    emp_ids = []
-    for i in range(200):
-        dept = random.choice(dept_ids)
-        cursor.execute("""
-            INSERT INTO employees (first_name, last_name, email, phone_number, hire_date, job_id, salary, department_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (fake.first_name(), fake.last_name(), fake.email(), fake.phone_number(),
-             fake.date_this_decade(), fake.job(), round(random.uniform(40000, 120000), 2), dept))
-        emp_ids.append(cursor.lastrowid)
-
-    # Insert sample projects
-    proj_ids = []
-    for i in range(30):
-        dept = random.choice(dept_ids)
-        cursor.execute("INSERT INTO projects (project_name, start_date, end_date, department_id) VALUES (?, ?, ?, ?)",
-                       (fake.bs().title(), fake.date_this_decade(), fake.date_this_decade(), dept))
-        proj_ids.append(cursor.lastrowid)
-
-    # Assign employees to projects
-    for i in range(500):
-        cursor.execute("INSERT INTO employee_projects (employee_id, project_id, role) VALUES (?, ?, ?)",
-                       (random.choice(emp_ids), random.choice(proj_ids), random.choice(["Developer", "Manager", "Tester", "Analyst"])))
-
-    # Insert sample clients
-    client_ids = []
-    for i in range(50):
-        cursor.execute("INSERT INTO clients (client_name, contact_email, contact_phone) VALUES (?, ?, ?)",
-                       (fake.company(), fake.email(), fake.phone_number()))
-        client_ids.append(cursor.lastrowid)
-
-    # Insert sample invoices
-    for i in range(200):
-        cursor.execute("INSERT INTO invoices (client_id, amount, invoice_date, status) VALUES (?, ?, ?, ?)",
-                       (random.choice(client_ids), round(random.uniform(1000, 50000), 2),
-                        fake.date_this_decade(), random.choice(["Paid", "Pending", "Overdue"])))
+    # Relax durability for the bulk load
+    cursor.execute("PRAGMA journal_mode=OFF;")
+    cursor.execute("PRAGMA synchronous=OFF;")
+    cursor.execute("PRAGMA temp_store=MEMORY;")
+    cursor.execute("PRAGMA cache_size=-262144;")
+
+    cities = _vocabulary(seed)["cities"]
+    cursor.executemany(INSERT_SQL["departments"],
+                       [(i, d, cities[i - 1]) for i, d in enumerate(DEPARTMENTS, start=1)])
 
+    pending_rows = 0
+    for table, rows in _generate_all(_load_tasks(counts, seed, batch_size), workers):
+        cursor.executemany(INSERT_SQL[table], rows)
+        pending_rows += len(rows)
+        if pending_rows >= COMMIT_ROWS:
+            conn.commit()
+            pending_rows = 0
     conn.commit()
+
+    # Secondary indexes for the common joins, filters and the alerts page
+    create_baseline_indexes(cursor)
+    cursor.execute("ANALYZE;")
+    conn.commit()
+
+    cursor.execute("PRAGMA synchronous=FULL;")
+    cursor.execute("PRAGMA journal_mode=DELETE;")
     conn.close()
-    print(f"{DB_PATH} created with sample data, users table, and audit_log table")
+
+    summary = ", ".join(f"{t}={n}" for t, n in counts.items())
+    print(f"{db_path} created with sample data, users table, and audit_log table "
+          f"({summary}; seed={seed}; {time.perf_counter() - started:.1f}s)")
+
+
+def _parse_counts(values):
+    counts = {}
+    for item in values or []:
+        table, _, n = item.partition("=")
+        if table not in BASE_COUNTS or not n.isdigit():
+            sys.exit(f"--count expects TABLE=N with TABLE in {', '.join(BASE_COUNTS)}")
+        counts[table] = int(n)
+    return counts
+
 
 if __name__ == "__main__":
-    create_company_db()
+    parser = argparse.ArgumentParser(description="Create the company database with generated data")
+    parser.add_argument("--db-path", default=DB_PATH)
+    parser.add_argument("--scale", type=float, default=1, help="multiplier for the base row counts")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data")
+    parser.add_argument("--workers", type=int, default=None, help="generator processes (default: CPUs)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--count", action="append", metavar="TABLE=N", help="override one table's row count")
+    args = parser.parse_args()
+
+    create_company_db(args.db_path, scale=args.scale, seed=args.seed, workers=args.workers,
+                      counts=_parse_counts(args.count), batch_size=args.batch_size)
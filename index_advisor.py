@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+from collections import defaultdict
+
+from utils import DB_PATH, get_pool
+
+# ------------------- BASELINE INDEXES ------------------- #
+# (index name, table, columns) created by create_company_db and on app start
+BASELINE_INDEXES = [
+    ("idx_employees_department_id", "employees", ("department_id",)),
+    ("idx_employee_projects_employee_project", "employee_projects", ("employee_id", "project_id")),
+    ("idx_employee_projects_project_id", "employee_projects", ("project_id",)),
+    ("idx_projects_department_id", "projects", ("department_id",)),
+    ("idx_invoices_client_id_status", "invoices", ("client_id", "status")),
+    ("idx_invoices_status", "invoices", ("status",)),
+    ("idx_audit_log_timestamp", "audit_log", ("timestamp",)),
+    ("idx_audit_log_user", "audit_log", ("user",)),
+    ("idx_audit_log_table_name", "audit_log", ("table_name",)),
+]
+
+
+def create_index_sql(name: str, table: str, columns) -> str:
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)});"
+
+
+def create_baseline_indexes(cursor):
+    """Create every baseline index whose table exists"""
+    tables = {r[0] for r in cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")}
+    for name, table, columns in BASELINE_INDEXES:
+        if table in tables:
+            cursor.execute(create_index_sql(name, table, columns))
+
+
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+
+def ensure_baseline_indexes(db_path=DB_PATH):
+    """Create missing baseline indexes once per process and database"""
+    key = os.path.abspath(db_path)
+    with _ensured_lock:
+        if key in _ensured:
+            return
+        with get_pool(db_path).connection() as conn:
+            create_baseline_indexes(conn.cursor())
+            conn.execute("PRAGMA optimize;")
+            conn.commit()
+        _ensured.add(key)
+
+
+# ------------------- PLAN ANALYSIS ------------------- #
+_SQL_WORDS = {
+    "select", "from", "where", "join", "inner", "left", "right", "outer", "cross", "on",
+    "group", "order", "by", "limit", "offset", "having", "as", "and", "or", "not", "in",
+    "is", "null", "like", "between", "desc", "asc", "using", "set", "values", "into",
+    "update", "delete", "insert", "natural", "union", "all", "distinct", "case", "when",
+    "then", "else", "end", "exists",
+}
+_TABLE_REF = re.compile(r"\b(?:from|join|update|into)\s+([A-Za-z_][\w]*)(?:\s+(?:as\s+)?([A-Za-z_]\w*))?",
+                        re.IGNORECASE)
+_FILTER_CLAUSE = re.compile(r"\b(?:where|on|having)\b(.*?)(?=\border\s+by\b|\bgroup\s+by\b|\blimit\b|$)",
+                            re.IGNORECASE | re.DOTALL)
+_ORDER_CLAUSE = re.compile(r"\b(?:order|group)\s+by\b(.*?)(?=\blimit\b|\border\s+by\b|$)",
+                           re.IGNORECASE | re.DOTALL)
+_SELECT_CLAUSE = re.compile(r"\bselect\b(.*?)\bfrom\b", re.IGNORECASE | re.DOTALL)
+_SCAN = re.compile(r"^SCAN (\w+)(?: AS (\w+))?(.*)$")
+
+
+def _strip_literals(query: str) -> str:
+    return re.sub(r"'(?:[^']|'')*'", "''", query)
+
+
+def _aliases(query: str) -> dict:
+    """alias/table name -> table name"""
+    mapping = {}
+    for table, alias in _TABLE_REF.findall(query):
+        mapping[table.lower()] = table.lower()
+        if alias and alias.lower() not in _SQL_WORDS:
+            mapping[alias.lower()] = table.lower()
+    return mapping
+
+
+def _referenced_columns(clause_text: str, table: str, aliases: dict, table_columns: set) -> list:
+    """Columns of `table` referenced in a clause, in order of first use"""
+    found = []
+    for qualifier, column in re.findall(r"(?:(\w+)\.)?(\w+)", clause_text):
+        column = column.lower()
+        if column not in table_columns or column in found:
+            continue
+        if qualifier and aliases.get(qualifier.lower()) != table:
+            continue
+        found.append(column)
+    return found
+
+
+def explain_plan(conn, query: str) -> list:
+    """EXPLAIN QUERY PLAN detail lines"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}")]
+
+
+def analyze_query(conn, query: str) -> dict:
+    """
+    Full scans and temp B-trees in a statement's plan, with the columns
+    an index on each scanned table could use (filters first, then ordering).
+    """
+    plan = explain_plan(conn, query)
+    text = _strip_literals(query)
+    aliases = _aliases(text)
+    filters = " ".join(_FILTER_CLAUSE.findall(text))
+    ordering = " ".join(_ORDER_CLAUSE.findall(text))
+    selected = " ".join(_SELECT_CLAUSE.findall(text))
+
+    scans, temp_btrees = [], []
+    for detail in plan:
+        if detail.startswith("USE TEMP B-TREE"):
+            temp_btrees.append(detail)
+            continue
+        match = _SCAN.match(detail)
+        if not match or "USING" in match.group(3):
+            continue
+        name = (match.group(2) or match.group(1)).lower()
+        table = aliases.get(name, match.group(1).lower())
+        table_columns = {c[1].lower() for c in conn.execute(f"PRAGMA table_info({table});")}
+        if not table_columns:
+            continue
+        columns = _referenced_columns(filters, table, aliases, table_columns)
+        for column in _referenced_columns(ordering, table, aliases, table_columns):
+            if column not in columns:
+                columns.append(column)
+        covering = list(columns)
+        if "*" not in selected:
+            for column in _referenced_columns(selected, table, aliases, table_columns):
+                if column not in covering:
+                    covering.append(column)
+        scans.append({"table": table, "columns": tuple(columns), "covering": tuple(covering),
+                      "detail": detail})
+
+    return {"plan": plan, "scans": scans, "temp_btrees": temp_btrees}
+
+
+# ------------------- ADVISOR ------------------- #
+class IndexAdvisor:
+    """
+    Aggregates full scans across executed statements and recommends
+    indexes for (table, columns) pairs seen at least `min_count` times.
+    With covering=True the selected columns are appended (up to
+    `max_covering_columns`) so the query can be answered from the index.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_examples=3, max_covering_columns=4):
+        self.db_path = db_path
+        self.max_examples = max_examples
+        self.max_covering_columns = max_covering_columns
+        self._lock = threading.Lock()
+        self._scans = defaultdict(lambda: {"count": 0, "examples": []})
+        self.statements = 0
+        self.temp_btrees = 0
+
+    def record(self, query: str) -> dict:
+        """Analyze one statement and add its findings to the history"""
+        try:
+            with get_pool(self.db_path).connection() as conn:
+                analysis = analyze_query(conn, query)
+        except Exception as e:
+            return {"error": str(e)}
+
+        with self._lock:
+            self.statements += 1
+            self.temp_btrees += len(analysis["temp_btrees"])
+            for scan in analysis["scans"]:
+                if not scan["columns"]:
+                    continue
+                entry = self._scans[(scan["table"], scan["columns"])]
+                entry["count"] += 1
+                entry["covering"] = max(entry.get("covering", ()), scan["covering"], key=len)
+                if len(entry["examples"]) < self.max_examples and query not in entry["examples"]:
+                    entry["examples"].append(query)
+        return analysis
+
+    def _existing_indexes(self, conn) -> set:
+        """(table, set of leading columns) already covered by an index"""
+        covered = set()
+        for name, table in conn.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type='index';").fetchall():
+            cols = tuple(c[2].lower() for c in conn.execute(f"PRAGMA index_info({name});") if c[2])
+            for i in range(1, len(cols) + 1):
+                covered.add((table.lower(), frozenset(cols[:i])))
+        return covered
+
+    def recommendations(self, min_count: int = 2, covering: bool = False) -> list:
+        """Index suggestions, most frequent first, skipping ones already covered"""
+        with self._lock:
+            history = {k: dict(v) for k, v in self._scans.items()}
+        with get_pool(self.db_path).connection() as conn:
+            covered = self._existing_indexes(conn)
+
+        result = []
+        for (table, columns), entry in sorted(history.items(), key=lambda kv: -kv[1]["count"]):
+            if entry["count"] < min_count or (table, frozenset(columns)) in covered:
+                continue
+            if covering:
+                columns = entry["covering"][:max(len(columns), self.max_covering_columns)]
+            name = f"idx_{table}_{'_'.join(columns)}"
+            result.append({
+                "table": table,
+                "columns": columns,
+                "count": entry["count"],
+                "sql": create_index_sql(name, table, columns),
+                "examples": entry["examples"],
+            })
+        return result
+
+    def apply(self, min_count: int = 2, covering: bool = False) -> list:
+        """Create the recommended indexes; returns the statements executed"""
+        applied = []
+        recs = self.recommendations(min_count, covering)
+        if not recs:
+            return applied
+        with get_pool(self.db_path).connection() as conn:
+            for rec in recs:
+                conn.execute(rec["sql"])
+                applied.append(rec["sql"])
+            conn.commit()
+        return applied
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "statements": self.statements,
+                "temp_btrees": self.temp_btrees,
+                "scan_patterns": len(self._scans),
+            }
+
+
+index_advisor = IndexAdvisor()
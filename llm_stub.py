@@ -0,0 +1,171 @@
+# llm_stub.py — local stand-in for the Groq chat-completions endpoint
+#
+#   python llm_stub.py --port 8089 --latency 0.2
+#   GROQ_BASE_URL=http://127.0.0.1:8089 GROQ_API_KEY=stub streamlit run app.py
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+STUB_TABLES = ("employees", "departments", "projects", "employee_projects",
+               "clients", "invoices", "audit_log")
+
+
+def default_responder(prompt: str, model: str) -> str:
+    """Answer with a SELECT on the first table named in the user question"""
+    question = prompt.rsplit("User Question:", 1)[-1].lower()
+    table = next((t for t in STUB_TABLES if re.search(rf"\b{t}\b", question)), "employees")
+    return f"```sql\nSELECT * FROM {table} LIMIT 10;\n```"
+
+
+class StubLLMServer:
+    """
+    Threaded HTTP server mimicking POST /openai/v1/chat/completions.
+    - `latency`: seconds to sleep before answering (float or callable(model))
+    - `responder(prompt, model)`: returns the completion text
+    - `fail_models`: models that answer HTTP 500
+    - `stream=true` requests get SSE chunks of `chunk_size` characters,
+      `chunk_delay` seconds apart
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, responder=default_responder,
+                 fail_models=(), chunk_size=8, chunk_delay=0.0):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.responder = responder
+        self.fail_models = set(fail_models)
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _delay(self, model):
+        latency = self.latency(model) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if self.path.split("?")[0] != COMPLETIONS_PATH:
+                    return self._send_json(404, {"error": {"message": "not found"}})
+
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = body.get("model", "")
+                prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+                with stub._lock:
+                    stub.requests.append(body)
+
+                stub._delay(model)
+                if model in stub.fail_models:
+                    return self._send_json(500, {"error": {"message": "stub failure"}})
+
+                content = stub.responder(prompt, model)
+                if body.get("stream"):
+                    return self._send_stream(model, prompt, content)
+                self._send_json(200, self._completion(model, prompt, content))
+
+            def _send_stream(self, model, prompt, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                chunk_id = f"stub-{time.time_ns()}"
+                pieces = [content[i:i + stub.chunk_size] for i in range(0, len(content), stub.chunk_size)]
+                for piece in pieces + [None]:
+                    chunk = {
+                        "id": chunk_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": piece} if piece is not None else {},
+                            "finish_reason": None if piece is not None else "stop",
+                        }],
+                    }
+                    if piece is None:          # Groq sends usage on the final chunk
+                        chunk["x_groq"] = {"usage": self._usage(prompt, content)}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if piece is not None and stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _completion(self, model, prompt, content):
+                return {
+                    "id": f"stub-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": self._usage(prompt, content),
+                }
+
+            def _usage(self, prompt, content):
+                return {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                }
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the Groq chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    args = parser.parse_args()
+
+    server = StubLLMServer(args.host, args.port, latency=args.latency)
+    print(f"Stub LLM listening on {server.base_url}{COMPLETIONS_PATH}")
+    server._server.serve_forever()
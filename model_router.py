@@ -0,0 +1,365 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from prompt_builder import get_schema_snapshot, select_tables
+from tracing import RollingHistogram
+
+# ------------------- CONFIG ------------------- #
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "llama-3.3-70b-versatile")
+ROUTING_ENABLED = os.getenv("LLM_ROUTING", "1") == "1"    # 0: always the large model
+COMPLEXITY_THRESHOLD = 3                  # score below this goes to the small model
+LLM_TIMEOUT = 30                          # seconds per request
+
+HEDGE_PERCENTILE = 0.95                   # hedge once a call is slower than this share of recent calls
+HEDGE_DEFAULT_DELAY = 3.0                 # seconds, until HEDGE_MIN_SAMPLES latencies are known
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+HEDGE_BUDGET = 0.1                        # at most ~10% extra requests from hedging
+
+MAX_RETRIES = 2                           # per model, after the first attempt
+RETRY_BASE_DELAY = 0.2                    # seconds; full jitter, doubling per attempt
+RETRY_MAX_DELAY = 2.0
+
+BREAKER_FAILURES = 5                      # consecutive failures / slow calls that open the breaker
+BREAKER_COOLDOWN = 30.0                   # seconds open before one trial call is let through
+BREAKER_SLOW_CALL = 10.0                  # seconds; slower successful calls count as failures
+
+_AGGREGATE = re.compile(r"\b(count|how many|total|sum|average|avg|mean|max|maximum|min|minimum|"
+                        r"highest|lowest|most|least)\b")
+_GROUPING = re.compile(r"\b(per|each|by|group|breakdown|distribution)\b")
+_NESTED = re.compile(r"\b(than (the )?(average|mean)|more than|less than|without|never|not any|no \w+ assigned|"
+                     r"top \d+|rank|ranking|compared?|percentage|ratio|share|both|either|except)\b")
+
+
+class LLMUnavailable(Exception):
+    """Every allowed model failed (or its breaker is open)"""
+
+
+def is_retryable(error) -> bool:
+    """Timeouts, connection errors, 429 and 5xx are worth retrying; 4xx request errors are not"""
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+# ------------------- COMPLEXITY ------------------- #
+def complexity_score(question: str, snapshot=None) -> dict:
+    """
+    Cheap routing score from the question text: tables it needs (relevance
+    scoring + join bridges from prompt_builder), aggregates, grouping and
+    nesting cues. {"score", "tables", "reasons"}
+    """
+    snapshot = get_schema_snapshot() if snapshot is None else snapshot
+    text = question.lower()
+    tables = select_tables(question, snapshot)
+    reasons = []
+    score = 0
+    if len(tables) == len(snapshot) and len(snapshot) > 1:
+        score += 3
+        reasons.append("no table named")
+    else:
+        score += 2 * (len(tables) - 1)
+        if len(tables) > 1:
+            reasons.append(f"{len(tables)} tables")
+    for name, pattern, weight in (("aggregate", _AGGREGATE, 1), ("grouping", _GROUPING, 1),
+                                  ("nested", _NESTED, 2)):
+        if pattern.search(text):
+            score += weight
+            reasons.append(name)
+    if len(text.split()) > 20:
+        score += 1
+        reasons.append("long question")
+    return {"score": score, "tables": tables, "reasons": reasons}
+
+
+# ------------------- CIRCUIT BREAKER ------------------- #
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures or slow calls;
+    open -> half_open after `cooldown` seconds (one trial call);
+    half_open -> closed on success, open again on failure.
+    A trial that ends without an outcome is released; one that never
+    reports back expires after another `cooldown`.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, slow_call=BREAKER_SLOW_CALL):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._trial = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.cooldown:
+                self.state, self._trial = "half_open", False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and (not self._trial or now - self._trial_started >= self.cooldown):
+                self._trial, self._trial_started = True, now
+                return True
+            return False
+
+    def release(self):
+        """The call let through by allow() ended without an outcome (cancelled)"""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        with self._lock:
+            if ok and elapsed <= self.slow_call:
+                self.state, self.consecutive = "closed", 0
+                return
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                if self.state != "open":
+                    self.trips += 1
+                self.state, self.opened_at = "open", time.monotonic()
+
+
+# ------------------- ROUTER ------------------- #
+class ModelRouter:
+    """
+    Picks the model per question and makes the chat-completion call:
+    - complexity score < threshold -> small model, else large model
+    - the other model is the fallback when retries are exhausted or the
+      chosen model's circuit breaker is open
+    - a hedged duplicate request is sent when the first one is slower
+      than the model's recent HEDGE_PERCENTILE latency; first answer wins
+    - retryable errors are retried with full-jitter exponential backoff
+    `client` is a Groq client; `async_client()` returns (AsyncGroq, semaphore).
+    """
+
+    def __init__(self, client, async_client=None, small_model=SMALL_MODEL, large_model=LARGE_MODEL,
+                 routing=ROUTING_ENABLED, threshold=COMPLEXITY_THRESHOLD, timeout=LLM_TIMEOUT,
+                 max_retries=MAX_RETRIES, breakers=None):
+        self.client = client
+        self.async_client = async_client
+        self.small_model = small_model
+        self.large_model = large_model
+        self.routing = routing
+        self.threshold = threshold
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breakers = breakers or {small_model: CircuitBreaker(), large_model: CircuitBreaker()}
+        self.latency = {small_model: RollingHistogram(), large_model: RollingHistogram()}
+        self.counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "fallbacks": 0}
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-call")
+        self._lock = threading.Lock()
+
+    # ---------------- decisions ----------------
+    def route(self, question: str) -> dict:
+        """{"models": [chosen, fallback], "complexity"}"""
+        complexity = complexity_score(question) if self.routing else {"score": None, "tables": [], "reasons": []}
+        small = self.routing and complexity["score"] < self.threshold
+        models = [self.small_model, self.large_model] if small else [self.large_model, self.small_model]
+        return {"models": models, "complexity": complexity}
+
+    def hedge_delay(self, model: str) -> float:
+        histogram = self.latency[model]
+        if len(histogram.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, histogram.quantile(HEDGE_PERCENTILE))
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.counters["hedges"] < self.counters["calls"] * HEDGE_BUDGET + 1:
+                self.counters["hedges"] += 1
+                return True
+            return False
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    def _record(self, model: str, ok: bool, elapsed: float):
+        if ok:
+            self.latency[model].observe(elapsed)
+        self.breakers[model].record(ok, elapsed)
+
+    def _completion(self, model, response, start, hedged, attempts, route) -> dict:
+        return {
+            "text": response.choices[0].message.content.strip(),
+            "model": model,
+            "usage": getattr(response, "usage", None),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "hedged": hedged,
+            "attempts": attempts,
+            "complexity": route["complexity"],
+        }
+
+    # ---------------- blocking ----------------
+    def _create(self, model: str, prompt: str, **kwargs):
+        return self.client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], timeout=self.timeout, **kwargs)
+
+    def _hedged_call(self, model: str, prompt: str) -> tuple:
+        """(response, hedged, winner was the hedge) for one attempt on `model`"""
+        futures = [self._executor.submit(self._create, model, prompt)]
+        done, _ = wait(futures, timeout=self.hedge_delay(model))
+        hedged = not done and self._may_hedge()
+        if hedged:
+            futures.append(self._executor.submit(self._create, model, prompt))
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result(), hedged, future is not futures[0]
+                error = future.exception()
+        raise error
+
+    def complete(self, prompt: str, question: str = "", route: dict = None) -> dict:
+        """Chat completion for `prompt` with routing (or a precomputed route()), hedging, retries and fallback"""
+        self._count("calls")
+        route = route or self.route(question or prompt)
+        start = time.perf_counter()
+        attempts, last_error = 0, None
+        for position, model in enumerate(route["models"]):
+            if position:
+                self._count("fallbacks")
+            for attempt in range(self.max_retries + 1):
+                if not self.breakers[model].allow():
+                    break
+                attempts += 1
+                call_start = time.perf_counter()
+                try:
+                    response, hedged, hedge_won = self._hedged_call(model, prompt)
+                except Exception as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        self.breakers[model].record(True)     # the model answered; the request was bad
+                        raise
+                    self._record(model, False, time.perf_counter() - call_start)
+                    if attempt < self.max_retries:
+                        self._count("retries")
+                        time.sleep(self._backoff(attempt))
+                    continue
+                except BaseException:
+                    self.breakers[model].release()        # cancelled / interrupted: no outcome
+                    raise
+                self._record(model, True, time.perf_counter() - call_start)
+                if hedge_won:
+                    self._count("hedge_wins")
+                return self._completion(model, response, start, hedged, attempts, route)
+        raise LLMUnavailable(f"No model answered after {attempts} attempt(s): {last_error or 'circuit open'}")
+
+    def open_stream(self, prompt: str, question: str = "", route: dict = None) -> tuple:
+        """
+        (model, stream) for a streaming completion: same routing, breaker,
+        retries and fallback, applied to opening the stream (no hedging).
+        """
+        self._count("calls")
+        route = route or self.route(question or prompt)
+        attempts, last_error = 0, None
+        for position, model in enumerate(route["models"]):
+            if position:
+                self._count("fallbacks")
+            for attempt in range(self.max_retries + 1):
+                if not self.breakers[model].allow():
+                    break
+                attempts += 1
+                call_start = time.perf_counter()
+                try:
+                    stream = self._create(model, prompt, stream=True)
+                except Exception as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        self.breakers[model].record(True)     # the model answered; the request was bad
+                        raise
+                    self._record(model, False, time.perf_counter() - call_start)
+                    if attempt < self.max_retries:
+                        self._count("retries")
+                        time.sleep(self._backoff(attempt))
+                    continue
+                except BaseException:
+                    self.breakers[model].release()
+                    raise
+                self.breakers[model].record(True)
+                return model, stream
+        raise LLMUnavailable(f"No model answered after {attempts} attempt(s): {last_error or 'circuit open'}")
+
+    # ---------------- async ----------------
+    async def _acreate(self, client, model: str, prompt: str):
+        return await client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], timeout=self.timeout)
+
+    async def _ahedged_call(self, client, model: str, prompt: str) -> tuple:
+        first = asyncio.ensure_future(self._acreate(client, model, prompt))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay(model))
+        hedged = not done and self._may_hedge()
+        pending = {first}
+        if hedged:
+            pending.add(asyncio.ensure_future(self._acreate(client, model, prompt)))
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), hedged, task is not first
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:          # the losing request is cancelled
+                task.cancel()
+
+    async def acomplete(self, prompt: str, question: str = "", route: dict = None) -> dict:
+        """complete() on the shared AsyncGroq client, bounded by its semaphore"""
+        self._count("calls")
+        route = route or await asyncio.to_thread(self.route, question or prompt)
+        client, semaphore = self.async_client()
+        start = time.perf_counter()
+        attempts, last_error = 0, None
+        for position, model in enumerate(route["models"]):
+            if position:
+                self._count("fallbacks")
+            for attempt in range(self.max_retries + 1):
+                if not self.breakers[model].allow():
+                    break
+                attempts += 1
+                call_start = time.perf_counter()
+                try:
+                    async with semaphore:
+                        response, hedged, hedge_won = await self._ahedged_call(client, model, prompt)
+                except Exception as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        self.breakers[model].record(True)     # the model answered; the request was bad
+                        raise
+                    self._record(model, False, time.perf_counter() - call_start)
+                    if attempt < self.max_retries:
+                        self._count("retries")
+                        await asyncio.sleep(self._backoff(attempt))
+                    continue
+                except BaseException:
+                    self.breakers[model].release()        # cancelled / interrupted: no outcome
+                    raise
+                self._record(model, True, time.perf_counter() - call_start)
+                if hedge_won:
+                    self._count("hedge_wins")
+                return self._completion(model, response, start, hedged, attempts, route)
+        raise LLMUnavailable(f"No model answered after {attempts} attempt(s): {last_error or 'circuit open'}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "breakers": {m: {"state": b.state, "trips": b.trips} for m, b in self.breakers.items()},
+            "hedge_delay_s": {m: round(self.hedge_delay(m), 3) for m in self.latency},
+        }
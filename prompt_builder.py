@@ -0,0 +1,168 @@
+import logging
+import os
+import re
+import threading
+
+from utils import DB_PATH, get_pool, get_schema_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# ------------------- CONFIG ------------------- #
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+CHARS_PER_TOKEN = 4                       # rough estimate for llama tokenizers
+MIN_RELATIVE_SCORE = 0.4                  # keep tables scoring >= 40% of the best one
+
+# Never shown to the LLM
+HIDDEN_TABLES = {"sqlite_sequence", "audit_log_archive"}     # archive rows are compressed blobs
+HIDDEN_COLUMNS = {"users": {"password_hash", "mfa_secret"}}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# ------------------- SCHEMA SNAPSHOT ------------------- #
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_schema_snapshot(db_path=DB_PATH) -> dict:
+    """
+    {table: {"columns": [...], "fks": [(column, ref_table, ref_column)]}}
+    introspected from the live DB and cached until the schema fingerprint changes
+    """
+    key = os.path.abspath(db_path)
+    fingerprint = get_schema_fingerprint(db_path)
+    with _snapshots_lock:
+        cached = _snapshots.get(key)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+    snapshot = {}
+    with get_pool(db_path).connection() as conn:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid;"
+        )]
+        for table in tables:
+            if table in HIDDEN_TABLES:
+                continue
+            hidden = HIDDEN_COLUMNS.get(table, set())
+            columns = [c[1] for c in conn.execute(f"PRAGMA table_info({table});") if c[1] not in hidden]
+            fks = [(fk[3], fk[2], fk[4] or fk[3]) for fk in conn.execute(f"PRAGMA foreign_key_list({table});")]
+            snapshot[table] = {"columns": columns, "fks": fks}
+
+    with _snapshots_lock:
+        _snapshots[key] = (fingerprint, snapshot)
+    return snapshot
+
+
+# ------------------- RELEVANCE SCORING ------------------- #
+def _question_terms(question: str) -> set:
+    words = set(re.findall(r"[a-z0-9_]+", question.lower()))
+    # "employees" also matches "employee", "invoices" -> "invoice"
+    return words | {w[:-1] for w in words if w.endswith("s") and len(w) > 3}
+
+
+def score_tables(question: str, snapshot: dict) -> dict:
+    """Relevance score per table from table/column names mentioned in the question"""
+    terms = _question_terms(question)
+    scores = {}
+    for table, info in snapshot.items():
+        score = 0
+        table_parts = set(table.split("_"))
+        if table in terms or table.rstrip("s") in terms:
+            score += 5
+        elif table_parts & terms:
+            score += 1
+        for column in info["columns"]:
+            if column in terms:
+                score += 3
+            elif set(column.split("_")) - {"id", "name", "date"} & terms:
+                score += 1
+        scores[table] = score
+    return scores
+
+
+def _linked(a: str, b: str, snapshot: dict) -> bool:
+    return any(ref == b for _, ref, _ in snapshot[a]["fks"]) or \
+        any(ref == a for _, ref, _ in snapshot[b]["fks"])
+
+
+def select_tables(question: str, snapshot: dict) -> list:
+    """Relevant tables (best first) plus link tables needed to join them"""
+    scores = score_tables(question, snapshot)
+    best = max(scores.values(), default=0)
+    if best == 0:
+        return list(snapshot)
+    chosen = [t for t, s in sorted(scores.items(), key=lambda kv: -kv[1])
+              if s >= best * MIN_RELATIVE_SCORE]
+
+    for a in list(chosen):
+        for b in list(chosen):
+            if a >= b or _linked(a, b, snapshot):
+                continue
+            bridge = next((t for t in snapshot if t not in chosen
+                           and _linked(t, a, snapshot) and _linked(t, b, snapshot)), None)
+            if bridge:
+                chosen.append(bridge)
+    return chosen
+
+
+def _bridges(tables: list, snapshot: dict) -> set:
+    """For each pair of unlinked tables in `tables`, the first table in it that joins them"""
+    bridges = set()
+    for a in tables:
+        for b in tables:
+            if a >= b or _linked(a, b, snapshot):
+                continue
+            bridge = next((t for t in tables if t not in (a, b)
+                           and _linked(t, a, snapshot) and _linked(t, b, snapshot)), None)
+            if bridge:
+                bridges.add(bridge)
+    return bridges
+
+
+def trim_tables(tables: list, scores: dict, snapshot: dict) -> list:
+    """`tables` without its least relevant one; a bridge stays while both tables it joins do"""
+    bridges = _bridges(tables, snapshot)
+    candidates = [t for t in tables if t not in bridges] or tables
+    drop = min(reversed(candidates), key=lambda t: scores.get(t, 0))     # ties: the later one
+    return [t for t in tables if t != drop]
+
+
+# ------------------- PROMPT ------------------- #
+def format_schema(tables: list, snapshot: dict) -> str:
+    lines = []
+    for table in tables:
+        lines.append(f"TABLE: {table}")
+        lines.append("    " + ", ".join(snapshot[table]["columns"]))
+    joins = [
+        f"    {table}.{col} -> {ref}.{ref_col}"
+        for table in tables for col, ref, ref_col in snapshot[table]["fks"] if ref in tables
+    ]
+    if joins:
+        lines.append("JOINS:")
+        lines.extend(joins)
+    return "\n".join(lines)
+
+
+def build_sql_prompt(template: str, question: str, db_path=DB_PATH,
+                     token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """
+    Fill `template` ({schema}, {question}) with only the tables relevant to
+    the question, dropping the least relevant ones to fit `token_budget`
+    (a bridge table is kept while both tables it joins are).
+    """
+    snapshot = get_schema_snapshot(db_path)
+    tables = select_tables(question, snapshot)
+
+    prompt = template.format(schema=format_schema(tables, snapshot), question=question)
+    scores = None
+    while estimate_tokens(prompt) > token_budget and len(tables) > 1:
+        scores = scores or score_tables(question, snapshot)
+        tables = trim_tables(tables, scores, snapshot)
+        prompt = template.format(schema=format_schema(tables, snapshot), question=question)
+
+    logger.info("SQL prompt: %d/%d tables (%s), %d chars, ~%d tokens",
+                len(tables), len(snapshot), ", ".join(tables), len(prompt), estimate_tokens(prompt))
+    return prompt
@@ -0,0 +1,195 @@
+import re
+import time
+from contextlib import contextmanager
+
+from schema_index import tokenize_sql
+
+# ------------------- CONFIG ------------------- #
+QUERY_TIMEOUT = 10.0                      # wall-clock seconds per statement
+QUERY_MAX_VM_STEPS = 500_000_000          # SQLite VM instructions per statement
+PROGRESS_INTERVAL = 10_000                # VM instructions between handler calls
+QUERY_MAX_PLAN_COST = 200_000_000         # estimated rows visited before a plan is refused
+SEARCH_ROWS = 10                          # rows per indexed lookup when sqlite_stat1 has no figure
+
+_TRAILING_COMMENTS = re.compile(r"(?:\s|--[^\n]*|/\*.*?\*/)*", re.DOTALL)
+_PLAN_STEP = re.compile(r"^(SCAN|SEARCH) (\w+)(?: AS \w+)?(.*)$")
+_AGGREGATE = re.compile(r"\b(count|sum|avg|min|max|group_concat|total)\s*\(|\bgroup\s+by\b|\bdistinct\b",
+                        re.IGNORECASE)
+
+
+# ------------------- AUTOMATIC LIMIT ------------------- #
+def has_top_level_limit(query: str) -> bool:
+    depth = 0
+    for kind, text, _, _ in tokenize_sql(query):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif kind == "word" and depth == 0 and text.lower() == "limit":
+            return True
+    return False
+
+
+def strip_terminator(query: str) -> str:
+    """Statement without its closing ';' and any comment after it"""
+    query = query.strip()
+    ends = [start for kind, text, start, _ in tokenize_sql(query) if kind == "other" and text == ";"]
+    if ends and _TRAILING_COMMENTS.fullmatch(query, ends[-1] + 1):
+        query = query[:ends[-1]]
+    return query.rstrip()
+
+
+def add_default_limit(query: str, limit: int) -> str:
+    """Append LIMIT to a SELECT that has none at the top level"""
+    if query.lstrip()[:6].upper() != "SELECT" or has_top_level_limit(query):
+        return query
+    return f"{strip_terminator(query)}\nLIMIT {int(limit)}"      # own line: a trailing -- comment can't hide it
+
+
+# ------------------- PLAN COST ------------------- #
+_FROM_END = {"where", "group", "order", "limit", "having", "union", "except", "intersect", "on", "using", "set"}
+_NOT_ALIAS = _FROM_END | {"join", "inner", "left", "cross", "natural", "outer", "as"}
+
+
+def table_aliases(query: str) -> dict:
+    """alias or table name (lowercase) -> table, for FROM/JOIN lists"""
+    tokens = [t for t in tokenize_sql(query) if t[0] in ("word", "other")]
+    aliases, in_from, expect_table = {}, False, False
+    for i, (kind, text, _, _) in enumerate(tokens):
+        word = text.lower()
+        if kind == "word" and word in ("from", "join", "update", "into"):
+            in_from = expect_table = True
+        elif text == "," and in_from:
+            expect_table = True
+        elif kind == "word" and word in _FROM_END:
+            in_from = expect_table = False
+        elif kind == "word" and expect_table:
+            expect_table = False
+            aliases[word] = word
+            j = i + 2 if i + 1 < len(tokens) and tokens[i + 1][1].lower() == "as" else i + 1
+            if j < len(tokens) and tokens[j][0] == "word" and tokens[j][1].lower() not in _NOT_ALIAS:
+                aliases[tokens[j][1].lower()] = word
+        elif text == "(":
+            expect_table = False
+    return aliases
+
+
+def table_row_estimates(conn) -> dict:
+    """Rows per table (and per index key) from sqlite_stat1, else MAX(rowid)"""
+    rows, per_key = {}, {}
+    try:
+        for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1;"):
+            numbers = [int(n) for n in str(stat).split() if n.isdigit()]
+            if numbers:
+                rows[table.lower()] = numbers[0]
+                if index and len(numbers) > 1:
+                    per_key[index.lower()] = numbers[1]
+    except Exception:
+        pass                              # no ANALYZE yet
+    return {"rows": rows, "per_key": per_key}
+
+
+def estimate_plan_cost(conn, query: str) -> dict:
+    """
+    Rough rows-visited estimate from EXPLAIN QUERY PLAN: nested loops of one
+    query level multiply (SCAN = table rows, SEARCH = rows per key), separate
+    levels/subqueries add. Returns {"cost", "plan", "temp_btree"}.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    stats = table_row_estimates(conn)
+    aliases = table_aliases(query)
+
+    def rows_of(name):
+        table = aliases.get(name.lower(), name.lower())
+        if table not in stats["rows"]:
+            try:
+                stats["rows"][table] = conn.execute(f"SELECT MAX(rowid) FROM {table};").fetchone()[0] or 0
+            except Exception:
+                stats["rows"][table] = 0
+        return stats["rows"][table]
+
+    loops = {}                            # parent id -> product of loop sizes
+    extra = 0
+    for _id, parent, _notused, detail in plan:
+        match = _PLAN_STEP.match(detail)
+        if not match:
+            continue
+        kind, table, rest = match.groups()
+        if kind == "SCAN":
+            factor = max(rows_of(table), 1)
+        elif "INTEGER PRIMARY KEY" in rest or "rowid=" in rest:
+            factor = 1
+        else:
+            index = re.search(r"INDEX (\w+)", rest)
+            factor = stats["per_key"].get(index.group(1).lower(), SEARCH_ROWS) if index else SEARCH_ROWS
+            if "AUTOMATIC" in rest:
+                extra += rows_of(table)   # the automatic index is built from a full scan
+        loops[parent] = loops.get(parent, 1) * factor
+
+    return {
+        "cost": sum(loops.values()) + extra,
+        "plan": [row[3] for row in plan],
+        "temp_btree": any("TEMP B-TREE" in row[3] for row in plan),
+    }
+
+
+def check_plan(conn, query: str, max_cost=QUERY_MAX_PLAN_COST) -> dict:
+    """
+    {"allowed", "cost", "reason"}: plans over `max_cost` are refused unless
+    they stream under a LIMIT (no sort / aggregate), where SQLite stops
+    after the first rows and the runtime budget still applies.
+    """
+    estimate = estimate_plan_cost(conn, query)
+    allowed = estimate["cost"] <= max_cost
+    reason = None
+    if not allowed and has_top_level_limit(query) and not estimate["temp_btree"] \
+            and not _AGGREGATE.search(query):
+        allowed, reason = True, "streams under LIMIT"
+    elif not allowed:
+        reason = (f"estimated {estimate['cost']:,} rows visited exceeds the limit of {max_cost:,} "
+                  "(missing join condition?)")
+    return {"allowed": allowed, "cost": estimate["cost"], "reason": reason}
+
+
+# ------------------- RUNTIME BUDGET ------------------- #
+class QueryBudget:
+    """Progress-handler state: interrupts the statement past its time or VM-step budget"""
+
+    def __init__(self, timeout=QUERY_TIMEOUT, max_steps=QUERY_MAX_VM_STEPS):
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.start = time.perf_counter()
+        self.steps = 0
+        self.reason = None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 2)
+
+    def __call__(self) -> int:
+        self.steps += PROGRESS_INTERVAL
+        if self.timeout and time.perf_counter() - self.start > self.timeout:
+            self.reason = "timeout"
+        elif self.max_steps and self.steps > self.max_steps:
+            self.reason = "step_limit"
+        return 1 if self.reason else 0
+
+    def error(self) -> dict:
+        limit = f"{self.timeout:g}s time" if self.reason == "timeout" else f"{self.max_steps:,} VM-step"
+        return {
+            "error": f"Query interrupted: exceeded the {limit} budget after {self.elapsed_ms:.0f} ms.",
+            "error_type": self.reason,
+            "elapsed_ms": self.elapsed_ms,
+            "vm_steps": self.steps,
+        }
+
+
+@contextmanager
+def query_budget(conn, timeout=QUERY_TIMEOUT, max_steps=QUERY_MAX_VM_STEPS):
+    """Run statements on `conn` under a QueryBudget (interrupted with OperationalError)"""
+    budget = QueryBudget(timeout, max_steps)
+    conn.set_progress_handler(budget, PROGRESS_INTERVAL)
+    try:
+        yield budget
+    finally:
+        conn.set_progress_handler(None, 0)
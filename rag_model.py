@@ -1,31 +1,74 @@
 import os
-import re
+import time
+import asyncio
+import weakref
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from langchain_core.prompts import PromptTemplate
 
 from dotenv import load_dotenv
-from groq import Groq
-from utils import execute_sql_query, extract_sql_from_llm
+from groq import Groq, AsyncGroq
+from utils import (execute_sql_query, extract_sql_from_llm, fetch_result_page,
+                   get_schema_fingerprint, StreamingSQLExtractor)
+from cache import TranslationCache
+from prompt_builder import build_sql_prompt, get_schema_snapshot
+from index_advisor import index_advisor
+from synonyms import load_synonyms, load_synonym_scopes, SynonymNormalizer
+from template_matcher import template_matcher
+from tracing import tracer
+from model_router import ModelRouter
 
 # Load API key
 load_dotenv()
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)     # ModelRouter retries
+translation_cache = TranslationCache()
+
+#  Async Groq client (one per event loop, shared HTTP connection pool)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+_async_groq = weakref.WeakKeyDictionary()
+
+
+def get_async_groq(concurrency: int = LLM_CONCURRENCY):
+    """(AsyncGroq client, semaphore) for the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _async_groq:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=30
+        )
+        client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=http_client, max_retries=0)
+        _async_groq[loop] = (client, asyncio.Semaphore(concurrency))
+    return _async_groq[loop]
+
+
+# Small / large model per question, hedging, retries, circuit breakers
+model_router = ModelRouter(groq_client, get_async_groq)
+
+
+# Executes SQL found mid-stream while the rest of the completion arrives
+_stream_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sql-stream")
+
+
+async def close_async_groq():
+    """Close the running loop's client and its connection pool"""
+    entry = _async_groq.pop(asyncio.get_running_loop(), None)
+    if entry:
+        await entry[0].close()
 
 #  Synonyms / Fuzzy Mapping 
-SYNONYMS = {
-    "staff": "employees",
-    "worker": "employees",
-    "projcts": "projects",
-    "assignment": "projects",
-    "dept": "departments",
-    "customer": "clients"
-}
+SYNONYMS = load_synonyms()                 # variant -> canonical (synonyms.json)
+_normalizer = SynonymNormalizer(SYNONYMS, load_synonym_scopes(), tables=get_schema_snapshot())
+
 
 def normalize_query(user_query: str) -> str:
-    """Clean user input: lowercase, fix spelling, replace synonyms."""
-    q = user_query
-    for word, actual in SYNONYMS.items():
-        q = re.sub(rf"\b{word}\b", actual, q, flags=re.IGNORECASE)
-    return q
+    """Clean user input: replace synonyms / common misspellings (single regex pass)."""
+    return _normalizer.normalize(user_query)
+
+
+def normalize_queries(user_queries) -> list:
+    """normalize_query for many questions"""
+    return _normalizer.normalize_many(user_queries)
 
 #  UPDATED SQL PROMPT (REPLACED COMPLETELY)
 SQL_PROMPT = """
@@ -39,43 +82,9 @@ Your responsibilities:
 
 DATABASE SCHEMA (very important, follow EXACT columns):
 --------------------------------------------------------
-TABLE: employees
-    employee_id, first_name, last_name, email, phone_number,
-    hire_date, job_id, salary, department_id
-
-TABLE: departments
-    department_id, department_name, manager_id, location_id
-
-TABLE: projects
-    project_id, project_name, start_date, end_date, department_id
-
-TABLE: employee_projects
-    employee_id, project_id, role
-
-TABLE: clients
-    client_id, client_name, contact_email, contact_phone
-
-TABLE: invoices
-    invoice_id, client_id, amount, invoice_date, status
-
-TABLE: users
-    id, username, password_hash, mfa_enabled, mfa_secret
-
-TABLE: audit_log
-    id, user, action, table_name, record_id, details, timestamp
+{schema}
 --------------------------------------------------------
 
-FUZZY SYNONYMS (apply automatically):
-- phone_number → phone, mobile, mob, cell, contact, phone no, mobile no
-- salary → income, pay, earnings
-- first_name → fname, firstname
-- last_name → lname, lastname, sirname
-- department → dept, dpt, dep
-- client → customer, buyer
-- project → task, assignment
-- hire_date → joining date, join date
-- email → mail, email id
-
 RULES:
 1. ALWAYS output a valid SQL query ONLY. No explanation.
 2. If user spelling is wrong, auto-correct it.
@@ -98,42 +107,260 @@ User Question: {question}
 
 # Prompt template
 sql_prompt_template = PromptTemplate(
-    input_variables=["question"],
+    input_variables=["schema", "question"],
     template=SQL_PROMPT
 )
 
 #  Groq LLM Wrapper 
-class GroqLangChainSQL:
-    def __init__(self):
-        self.model_name = "llama-3.3-70b-versatile"
+ALLOWED_SQL = ("SELECT", "INSERT", "UPDATE", "DELETE")
 
-    def run(self, user_question: str, user: str = "system") -> dict:
-        """Generate SQL from question and execute it on DB"""
-        normalized_q = normalize_query(user_question)
-        prompt = SQL_PROMPT.format(question=normalized_q)
 
-        response = groq_client.chat.completions.create(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
-            timeout=30
-        )
-        llm_output = response.choices[0].message.content.strip()
+def is_executable_sql(sql_query) -> bool:
+    """True if the text is a statement the pipeline is allowed to run"""
+    return bool(sql_query) and sql_query.lstrip().upper().startswith(ALLOWED_SQL)
 
-        sql_query = extract_sql_from_llm(llm_output)
 
-        if sql_query and sql_query.upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE")):
-            result = execute_sql_query(sql_query)
-            if isinstance(result, list) and result and isinstance(result[0], dict):
-                columns = list(result[0].keys())
-                rows = [list(r.values()) for r in result]
-                result = {"columns": columns, "rows": rows}
+class GroqLangChainSQL:
+    def _prepare(self, user_question: str) -> dict:
+        """
+        Normalize the question, then look it up in the translation cache and
+        the template matcher; the LLM prompt is only built if both miss.
+        """
+        start = time.perf_counter()
+        with tracer.span("normalize"):
+            normalized_q = normalize_query(user_question)
+        route = model_router.route(normalized_q)      # deterministic: the cache is namespaced by the routed model
+        with tracer.span("translation_cache"):
+            schema_fp = get_schema_fingerprint()
+            cached_sql = translation_cache.get(normalized_q, schema_fp, route["models"][0])
+        template = prompt = None
+        if cached_sql is None:
+            with tracer.span("template"):
+                template = template_matcher.answer(normalized_q)
+        if cached_sql is None and template is None:
+            with tracer.span("prompt_build"):
+                prompt = build_sql_prompt(SQL_PROMPT, normalized_q)
+        return {
+            "question": normalized_q,
+            "schema_fp": schema_fp,
+            "route": route,
+            "cached_sql": cached_sql,
+            "template": template,
+            "prompt": prompt,
+            "start": start,
+        }
+
+    def _fast_path(self, prep: dict):
+        """generate() result without an LLM call (cache hit or template), else None"""
+        if prep["cached_sql"] is not None:
+            return self._generated(prep)
+        if prep["template"] is not None:
+            generated = self._generated(prep, prep["template"]["sql"], prep["template"]["sql"])
+            generated["template"] = {k: prep["template"][k] for k in ("template", "confidence")}
+            return generated
+        return None
+
+    def _generated(self, prep: dict, llm_output: str = None, sql_query: str = None, model: str = None) -> dict:
+        """Build the generate() result from a cache hit, a template or a completion by `model`"""
+        if llm_output is None:
+            sql_query, llm_output, cached = prep["cached_sql"], prep["cached_sql"], True
+        elif prep.get("template") is not None:
+            cached = False                      # templates are cheap, not cached
         else:
-            sql_query = None
-            result = {"columns": ["Answer"], "rows": [[llm_output]]}
+            cached = False
+            if sql_query is None:
+                with tracer.span("extract_sql"):
+                    sql_query = extract_sql_from_llm(llm_output)
+            if not is_executable_sql(sql_query):
+                sql_query = None
+            elif model:                         # a fallback model's answer is stored under its own name
+                translation_cache.put(prep["question"], prep["schema_fp"], sql_query, model)
+
+        generated = {
+            "sql": sql_query,
+            "llm_output": llm_output,
+            "cached": cached,
+            "elapsed_ms": round((time.perf_counter() - prep["start"]) * 1000, 2)
+        }
+        if model:
+            generated["model"] = model
+        return generated
+
+    def _completed(self, prep: dict, completion: dict) -> dict:
+        """generate() result from a ModelRouter completion"""
+        tracer.observe_usage(completion["usage"])
+        return self._generated(prep, completion["text"], model=completion["model"])
+
+    def generate(self, user_question: str) -> dict:
+        """Generate SQL from question (no execution); repeat and common questions skip the LLM"""
+        with tracer.trace("generate"):
+            prep = self._prepare(user_question)
+            fast = self._fast_path(prep)
+            if fast is not None:
+                return fast
+
+            with tracer.span("llm"):
+                completion = model_router.complete(prep["prompt"], prep["question"], prep["route"])
+            return self._completed(prep, completion)
+
+    async def agenerate(self, user_question: str) -> dict:
+        """generate() on the shared AsyncGroq client, bounded by the LLM semaphore"""
+        with tracer.trace("generate"):
+            prep = await asyncio.to_thread(self._prepare, user_question)
+            fast = self._fast_path(prep)
+            if fast is not None:
+                return fast
 
+            with tracer.span("llm"):
+                completion = await model_router.acomplete(prep["prompt"], prep["question"], prep["route"])
+            return self._completed(prep, completion)
+
+    def execute(self, sql_query: str, user: str = "system", page_size: int = None) -> dict:
+        """Validate and execute an SQL statement exactly once (first page only if page_size)"""
+        if not is_executable_sql(sql_query):
+            return {"error": "Only SELECT, INSERT, UPDATE, DELETE queries are allowed.",
+                    "columns": [], "rows": []}
+
+        # misspelled names in LLM output are corrected and retried without another LLM call
+        if page_size:
+            result = fetch_result_page(sql_query, page=0, page_size=page_size, user=user, auto_correct=True)
+        else:
+            result = execute_sql_query(sql_query, user=user, auto_correct=True)
+        if "error" not in result and not result.get("cached"):
+            index_advisor.record(result.get("corrected_sql", sql_query))
         result.setdefault("columns", [])
         result.setdefault("rows", [])
+        return result
+
+    def respond(self, generated: dict, result) -> dict:
+        """run()-style {"sql", "results", "timings"} from a generate() result and execute() result (or None)"""
+        timings = {"generate_ms": generated["elapsed_ms"], "cached": generated["cached"]}
+        if generated.get("model"):
+            timings["model"] = generated["model"]
+        if generated.get("template"):
+            timings["template"] = generated["template"]
+        sql_query = generated["sql"]
+        if sql_query is None:
+            result = {"columns": ["Answer"], "rows": [[generated["llm_output"]]]}
+        elif result is not None:
+            timings["execute_ms"] = result.get("elapsed_ms")
+            if result.get("corrections"):
+                sql_query = result["corrected_sql"]
+        return {"sql": sql_query, "results": result, "timings": timings}
+
+    def run(self, user_question: str, user: str = "system", execute: bool = True,
+            page_size: int = None) -> dict:
+        """
+        Generate SQL from question and execute it on DB (once).
+        Returns {"sql", "results", "timings"}; with execute=False
+        "results" is None and the SQL is only generated. With page_size
+        only the first page of a SELECT is fetched (see fetch_result_page).
+        """
+        with tracer.trace("run", user=user):
+            generated = self.generate(user_question)
+            result = None
+            if generated["sql"] is not None and execute:
+                result = self.execute(generated["sql"], user=user, page_size=page_size)
+            return self.respond(generated, result)
+
+    async def arun(self, user_question: str, user: str = "system", execute: bool = True,
+                   page_size: int = None) -> dict:
+        """Async run(): LLM call on AsyncGroq, SQLite execution in a worker thread"""
+        with tracer.trace("run", user=user):
+            generated = await self.agenerate(user_question)
+            result = None
+            if generated["sql"] is not None and execute:
+                result = await asyncio.to_thread(self.execute, generated["sql"], user, page_size)
+            return self.respond(generated, result)
+
+    def run_stream(self, user_question: str, user: str = "system", execute: bool = True,
+                   page_size: int = None):
+        """
+        Streaming run(): yields events as the completion arrives
+        - {"type": "token", "text"}       raw completion chunks
+        - {"type": "sql", "sql"}          as soon as the statement is complete
+        - {"type": "result", "results"}   when execution (started early) finishes
+        - {"type": "done", "response"}    final run()-style response
+        """
+        with tracer.trace("stream", user=user):
+            yield from self._run_stream(user_question, user, execute, page_size)
+
+    def _run_stream(self, user_question, user, execute, page_size):
+        prep = self._prepare(user_question)
+        generated = self._fast_path(prep)
+        if generated is not None:
+            yield {"type": "sql", "sql": generated["sql"]}
+            result = self.execute(generated["sql"], user=user, page_size=page_size) if execute else None
+            if result is not None:
+                yield {"type": "result", "results": result}
+            yield {"type": "done", "response": self.respond(generated, result)}
+            return
+
+        extractor = StreamingSQLExtractor()
+        future = None
+        result = None
+        first_token = None
+        llm_start = time.perf_counter()
+        model, stream = model_router.open_stream(prep["prompt"], prep["question"], prep["route"])
+        for chunk in stream:
+            # Groq reports token usage on the last chunk
+            tracer.observe_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            if first_token is None:
+                first_token = time.perf_counter()
+                tracer.record("llm_first_token", (first_token - llm_start) * 1000)
+            yield {"type": "token", "text": text}
+
+            sql_query = extractor.feed(text)
+            if sql_query is not None and is_executable_sql(sql_query):
+                yield {"type": "sql", "sql": sql_query}
+                if execute:
+                    future = _stream_executor.submit(contextvars.copy_context().run,
+                                                     self.execute, sql_query, user, page_size)
+
+            if future is not None and result is None and future.done():
+                result = future.result()
+                yield {"type": "result", "results": result}
+
+        tracer.record("llm", (time.perf_counter() - llm_start) * 1000, model=model)
+
+        # keeps the statement that was detected (and executed) early
+        generated = self._generated(prep, extractor.buffer.strip(), extractor.finish(), model)
+
+        if generated["sql"] is not None and execute and result is None:
+            if future is None:
+                yield {"type": "sql", "sql": generated["sql"]}
+                future = _stream_executor.submit(contextvars.copy_context().run,
+                                                 self.execute, generated["sql"], user, page_size)
+            result = future.result()
+            yield {"type": "result", "results": result}
+
+        yield {"type": "done", "response": self.respond(generated, result)}
+
+    async def arun_batch(self, questions, user: str = "system", execute: bool = True) -> list:
+        """Translate (and run) many questions concurrently; errors are returned per item"""
+        results = await asyncio.gather(
+            *(self.arun(q, user=user, execute=execute) for q in questions),
+            return_exceptions=True
+        )
+        return [
+            {"sql": None, "results": {"error": str(r), "columns": [], "rows": []}, "timings": {}}
+            if isinstance(r, Exception) else r
+            for r in results
+        ]
+
+    def run_batch(self, questions, user: str = "system", execute: bool = True,
+                  concurrency: int = LLM_CONCURRENCY) -> list:
+        """Blocking wrapper around arun_batch with at most `concurrency` LLM calls in flight"""
+        async def _batch():
+            get_async_groq(concurrency)
+            try:
+                return await self.arun_batch(questions, user=user, execute=execute)
+            finally:
+                await close_async_groq()
 
-        return {"sql": sql_query, "results": result}
+        return asyncio.run(_batch())
 
 llm_sql = GroqLangChainSQL()
@@ -0,0 +1,170 @@
+import re
+
+from synonyms import load_synonyms
+
+# ------------------- CONFIG ------------------- #
+MIN_SIMILARITY = 0.6                      # below this an identifier is left as is
+
+
+def identifier_synonyms() -> dict:
+    """synonyms.json variants as SQL identifiers ("phone no" -> phone_no)"""
+    return {variant.replace(" ", "_"): canonical for variant, canonical in load_synonyms().items()}
+
+
+SQL_KEYWORDS = {
+    "select", "from", "where", "join", "inner", "left", "right", "full", "outer", "cross", "on",
+    "group", "order", "by", "limit", "offset", "having", "as", "and", "or", "not", "in", "is",
+    "null", "like", "glob", "between", "desc", "asc", "using", "set", "values", "into", "update",
+    "delete", "insert", "natural", "union", "all", "distinct", "case", "when", "then", "else",
+    "end", "exists", "with", "recursive", "true", "false", "default", "replace", "ignore",
+    "collate", "nocase", "escape", "intersect", "except", "cast", "integer", "text", "real",
+    "current_date", "current_time", "current_timestamp", "rowid", "over", "partition", "returning",
+}
+
+_TOKEN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<other>\S)
+""", re.VERBOSE)
+_TABLE_CONTEXT = {"from", "join", "update", "into"}
+
+
+def tokenize_sql(sql: str) -> list:
+    """[(kind, text, start, end)] with string literals and quoted names kept whole"""
+    return [(m.lastgroup, m.group(), m.start(), m.end()) for m in _TOKEN.finditer(sql)]
+
+
+# ------------------- SIMILARITY ------------------- #
+def _trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance (two-row DP)"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+# ------------------- INDEX ------------------- #
+class SchemaIndex:
+    """
+    Table and column names of one schema, with trigram sets precomputed,
+    for mapping misspelled or synonym identifiers to real ones.
+    """
+
+    def __init__(self, tables: dict, synonyms=None):
+        self.tables = {t.lower(): [c.lower() for c in cols] for t, cols in tables.items()}
+        self.columns = sorted({c for cols in self.tables.values() for c in cols})
+        self.synonyms = dict(identifier_synonyms() if synonyms is None else synonyms)
+        self._grams = {name: _trigrams(name) for name in list(self.tables) + self.columns}
+
+    @classmethod
+    def from_connection(cls, conn, synonyms=None):
+        tables = {}
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table';").fetchall():
+            tables[table] = [c[1] for c in conn.execute(f"PRAGMA table_info({table});")]
+        return cls(tables, synonyms)
+
+    def _similarity(self, term: str, name: str) -> float:
+        grams = self._grams.get(name) or _trigrams(name)
+        term_grams = _trigrams(term)
+        dice = 2 * len(term_grams & grams) / (len(term_grams) + len(grams))
+        edit = 1 - edit_distance(term, name) / max(len(term), len(name))
+        score = max(dice, edit)
+        if term in name.split("_"):
+            score = max(score, 0.7)           # "phone" -> contact_phone
+        return score
+
+    def lookup(self, word: str, candidates) -> tuple:
+        """(closest candidate, score) for `word`, trying its synonym too; (None, 0) if none is close"""
+        word = word.lower()
+        terms = [word]
+        if word in self.synonyms:
+            terms.insert(0, self.synonyms[word])
+        best, best_score = None, 0.0
+        for term in terms:
+            for name in candidates:
+                score = 1.0 if term == name else self._similarity(term, name)
+                if score > best_score:
+                    best, best_score = name, score
+        return (best, best_score) if best_score >= MIN_SIMILARITY else (None, 0.0)
+
+    def correct(self, sql: str) -> dict:
+        """
+        Map every unknown identifier in `sql` to its closest table/column.
+        Columns are matched against the tables the statement references
+        (the qualifier's table for `alias.column`).
+        Returns {"sql": corrected statement, "corrections": {wrong: right}}.
+        """
+        tokens = tokenize_sql(sql)
+        words = [(i, t[1].lower()) for i, t in enumerate(tokens) if t[0] == "word"]
+        replace = {}                           # token index -> new text
+        aliases = {}                           # alias / table name -> table
+        known_names = set()                    # column aliases defined with AS
+
+        def token(i):
+            return tokens[i][1].lower() if 0 <= i < len(tokens) else ""
+
+        # pass 1: table references and their aliases
+        for i, word in words:
+            if token(i - 1) == "as":
+                known_names.add(word)
+            if token(i - 1) not in _TABLE_CONTEXT or token(i + 1) in (".", "("):
+                continue
+            table = word if word in self.tables else self.lookup(word, self.tables)[0]
+            if table is None:
+                continue
+            if table != word:
+                replace[i] = table
+            aliases[word] = aliases[table] = table
+            j = i + 2 if token(i + 1) == "as" else i + 1
+            if j < len(tokens) and tokens[j][0] == "word" and token(j) not in SQL_KEYWORDS:
+                aliases[token(j)] = table
+
+        referenced = sorted(set(aliases.values()))
+        default_columns = sorted({c for t in referenced for c in self.tables[t]}) or self.columns
+
+        # pass 2: qualifiers and columns
+        for i, word in words:
+            if i in replace or word in SQL_KEYWORDS or word in known_names or token(i + 1) == "(":
+                continue
+            if token(i + 1) == ".":                       # qualifier
+                if word not in aliases and word not in self.tables:
+                    table = self.lookup(word, self.tables)[0]
+                    if table:
+                        replace[i] = table
+                continue
+            if word in aliases and token(i - 1) != ".":
+                continue
+            if token(i - 1) == ".":
+                qualifier = replace.get(i - 2, token(i - 2))
+                table = aliases.get(qualifier, qualifier if qualifier in self.tables else None)
+                candidates = self.tables.get(table) or default_columns
+            else:
+                candidates = default_columns + sorted(known_names)
+            if word in candidates:
+                continue
+            column = self.lookup(word, candidates)[0]
+            if column:
+                replace[i] = column
+
+        corrections = {}
+        parts, last = [], 0
+        for i, (_, text, start, end) in enumerate(tokens):
+            if i in replace:
+                parts.append(sql[last:start])
+                parts.append(replace[i])
+                corrections[text] = replace[i]
+                last = end
+        parts.append(sql[last:])
+        return {"sql": "".join(parts), "corrections": corrections}
@@ -0,0 +1,292 @@
+# service.py — HTTP API for the SQL agent (asyncio / tornado)
+#
+#   python service.py token alice                  # print a session token for alice
+#   python service.py serve --port 8090
+#   curl -H "Authorization: Bearer $TOKEN" -d '{"question": "list employees"}' localhost:8090/query
+#
+# Endpoints (JSON in / out, Bearer token from utils.create_session_token):
+#   POST /query  {"question", "execute": true, "page_size": null}  -> llm_sql.run() response
+#   POST /sql    {"sql", "max_rows": 1000}                         -> execute_sql_query() result
+#   GET  /stats                                                   -> coalescing / admission / pool counters
+#   GET  /metrics                                                 -> stage latency / token metrics (Prometheus text)
+# Identical questions (and identical read statements) in flight at the same
+# time share one LLM call and one DB execution.
+import os
+import json
+import time
+import signal
+import asyncio
+import argparse
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+import tornado.httpserver
+
+from tracing import tracer
+from utils import (DB_PATH, execute_sql_query, create_session_token, verify_session_token, get_pool_stats,
+                   flush_audit_log)
+
+# ------------------- CONFIG ------------------- #
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8090"))
+SERVICE_DB_WORKERS = int(os.getenv("SERVICE_DB_WORKERS", "8"))        # threads running SQL
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "64"))     # distinct jobs admitted at once
+SERVICE_REQUEST_TIMEOUT = float(os.getenv("SERVICE_REQUEST_TIMEOUT", "60"))
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+MAX_BODY_BYTES = 64 * 1024
+SHUTDOWN_GRACE = 30                       # seconds to drain in-flight jobs on SIGTERM / SIGINT
+
+
+# ------------------- RATE LIMIT ------------------- #
+class RateLimiter:
+    """Token bucket per user: `per_minute` sustained, `burst` at once"""
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}                # user -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def acquire(self, user) -> float:
+        """0 if the request may proceed, else seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(user, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[user] = (tokens - 1, now)
+                return 0.0
+            self._buckets[user] = (tokens, now)
+            return (1 - tokens) / self.rate if self.rate else float("inf")
+
+
+# ------------------- COALESCING + ADMISSION ------------------- #
+class Overloaded(Exception):
+    pass
+
+
+class InflightTable:
+    """
+    key -> running task. A caller with the key of a running job awaits
+    that job instead of starting another (free: it adds no work). New jobs
+    are admitted only while fewer than `max_pending` run; beyond that
+    callers get Overloaded and the service answers 503 with Retry-After.
+    """
+
+    def __init__(self, max_pending=SERVICE_MAX_PENDING):
+        self.max_pending = max_pending
+        self._tasks = {}
+        self.started = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def run(self, key, factory):
+        """Await the job for `key`, starting factory() if none is in flight"""
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            if len(self._tasks) >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(f"{len(self._tasks)} jobs in flight")
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self.started += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # one caller disconnecting must not cancel the job the others wait on
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._tasks), "max_pending": self.max_pending,
+                "started": self.started, "coalesced": self.coalesced, "rejected": self.rejected}
+
+
+# ------------------- SERVICE ------------------- #
+def is_read_only(sql_query) -> bool:
+    return bool(sql_query) and sql_query.lstrip().upper().startswith("SELECT")
+
+
+class AgentService:
+    """Shared state of one server process: LLM wrapper, DB threads, limits"""
+
+    def __init__(self, llm_sql, max_pending=SERVICE_MAX_PENDING, db_workers=SERVICE_DB_WORKERS,
+                 rate_limiter=None, timeout=SERVICE_REQUEST_TIMEOUT):
+        self.llm_sql = llm_sql
+        self.inflight = InflightTable(max_pending)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="service-sql")
+        self._writes = 0
+
+    def _in_thread(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _execute_key(self, sql_query, *params):
+        """Shared key for read statements; writes always run for their own caller"""
+        if is_read_only(sql_query):
+            return ("sql", " ".join(sql_query.split()), *params)
+        self._writes += 1
+        return ("write", self._writes)
+
+    async def query(self, question, user, execute=True, page_size=None) -> dict:
+        from rag_model import normalize_query
+        key = " ".join(normalize_query(question).lower().split())
+        generated = await self.inflight.run(("generate", key), lambda: self.llm_sql.agenerate(question))
+        result = None
+        sql_query = generated["sql"]
+        if sql_query is not None and execute:
+            result = await self.inflight.run(
+                self._execute_key(sql_query, page_size),
+                lambda: self._in_thread(self.llm_sql.execute, sql_query, user, page_size))
+        return self.llm_sql.respond(generated, result)
+
+    async def sql(self, sql_query, user, max_rows) -> dict:
+        return await self.inflight.run(
+            self._execute_key(sql_query, max_rows),
+            lambda: self._in_thread(partial(execute_sql_query, sql_query, DB_PATH, user, max_rows)))
+
+    def stats(self) -> dict:
+        from rag_model import model_router
+        return {**self.inflight.stats(), "models": model_router.stats(), "pools": get_pool_stats()}
+
+    async def drain(self, grace=SHUTDOWN_GRACE):
+        """Wait (up to `grace` s) for admitted jobs, then release resources"""
+        deadline = time.monotonic() + grace
+        while len(self.inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self.executor.shutdown(wait=False)
+        flush_audit_log()
+
+
+# ------------------- HTTP ------------------- #
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+        self.user = None
+
+    def prepare(self):
+        header = self.request.headers.get("Authorization", "")
+        token = header[7:].strip() if header.lower().startswith("bearer ") else ""
+        session = verify_session_token(token) if token else {"valid": False, "error": "Missing bearer token"}
+        if not session["valid"]:
+            return self.send_json(401, {"error": session["error"]})
+        self.user = session["user_id"]
+
+        wait = self.service.rate_limiter.acquire(self.user)
+        if wait:
+            self.set_header("Retry-After", str(max(1, round(wait))))
+            return self.send_json(429, {"error": f"Rate limit exceeded for {self.user}", "retry_after": wait})
+
+    def body_json(self) -> dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+        return body
+
+    def send_json(self, status, payload):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload, default=str))
+
+    def write_error(self, status_code, **kwargs):
+        self.send_json(status_code, {"error": self._reason})
+
+    async def run_job(self, job):
+        """Await `job` under the request timeout, mapping overload / timeout to 503 / 504"""
+        try:
+            payload = await asyncio.wait_for(job, self.service.timeout)
+        except Overloaded as e:
+            self.set_header("Retry-After", "1")
+            return self.send_json(503, {"error": f"Service busy ({e}), retry shortly"})
+        except asyncio.TimeoutError:
+            return self.send_json(504, {"error": f"Request exceeded {self.service.timeout:g}s"})
+        except Exception as e:
+            return self.send_json(500, {"error": str(e)})
+        self.send_json(400 if isinstance(payload, dict) and payload.get("error") else 200, payload)
+
+
+class QueryHandler(BaseHandler):
+    async def post(self):
+        body = self.body_json()
+        question = str(body.get("question") or "").strip()
+        if not question:
+            raise tornado.web.HTTPError(400, reason="'question' is required")
+        page_size = body.get("page_size")
+        await self.run_job(self.service.query(question, self.user, execute=bool(body.get("execute", True)),
+                                              page_size=int(page_size) if page_size else None))
+
+
+class SQLHandler(BaseHandler):
+    async def post(self):
+        body = self.body_json()
+        sql_query = str(body.get("sql") or "").strip()
+        if not sql_query:
+            raise tornado.web.HTTPError(400, reason="'sql' is required")
+        await self.run_job(self.service.sql(sql_query, self.user, int(body.get("max_rows", 1000))))
+
+
+class StatsHandler(BaseHandler):
+    def get(self):
+        self.send_json(200, self.service.stats())
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.finish(tracer.to_prometheus())
+
+
+def make_app(service) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/query", QueryHandler, {"service": service}),
+        (r"/sql", SQLHandler, {"service": service}),
+        (r"/stats", StatsHandler, {"service": service}),
+        (r"/metrics", MetricsHandler, {"service": service}),
+    ])
+
+
+async def serve(port=SERVICE_PORT, host="127.0.0.1", max_pending=SERVICE_MAX_PENDING):
+    from rag_model import llm_sql, close_async_groq
+
+    service = AgentService(llm_sql, max_pending=max_pending)
+    server = tornado.httpserver.HTTPServer(make_app(service), max_body_size=MAX_BODY_BYTES)
+    server.listen(port, address=host)
+    print(f"SQL agent service listening on http://{host}:{port}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    server.stop()                          # no new connections; admitted jobs finish
+    await service.drain()
+    await close_async_groq()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for the SQL agent")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="run the HTTP service")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=SERVICE_PORT)
+    p_serve.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING)
+
+    p_token = sub.add_parser("token", help="print a session token for a user")
+    p_token.add_argument("user")
+    p_token.add_argument("--minutes", type=int, default=60)
+
+    args = parser.parse_args()
+    if args.command == "token":
+        print(create_session_token(args.user, expiry_minutes=args.minutes))
+    else:
+        asyncio.run(serve(args.port, args.host, args.max_pending))
@@ -0,0 +1,79 @@
+import json
+import os
+import re
+
+# ------------------- CONFIG ------------------- #
+# {"canonical name": ["variant", ...]} or {"canonical name": {"variants": [...], "tables": [...]}};
+# a scoped entry is only applied when the question names one of its tables
+# or no table at all ("pay" is salary for employees, not for clients).
+# "contact" is deliberately absent (contact_email vs contact_phone vs phone_number is ambiguous)
+SYNONYMS_PATH = os.getenv("SYNONYMS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "synonyms.json"))
+
+_loaded = {}
+
+
+def _read(path=None) -> dict:
+    """{canonical: {"variants": [...], "tables": [...] or None}}, read once per path"""
+    path = path or SYNONYMS_PATH
+    if path not in _loaded:
+        with open(path, encoding="utf-8") as f:
+            groups = json.load(f)
+        _loaded[path] = {
+            canonical: entry if isinstance(entry, dict) else {"variants": entry, "tables": None}
+            for canonical, entry in groups.items()
+        }
+    return _loaded[path]
+
+
+def load_synonyms(path=None) -> dict:
+    """variant (lowercase, single-spaced) -> canonical name"""
+    return {
+        " ".join(variant.lower().split()): canonical
+        for canonical, entry in _read(path).items() for variant in entry["variants"]
+    }
+
+
+def load_synonym_scopes(path=None) -> dict:
+    """canonical name -> tables it applies to, for scoped entries only"""
+    return {canonical: set(entry["tables"]) for canonical, entry in _read(path).items() if entry.get("tables")}
+
+
+class SynonymNormalizer:
+    """
+    All synonyms compiled into one alternation regex (longest variant
+    first, whole words, any whitespace between words), so a question is
+    normalized in a single pass whatever the dictionary size. A scoped
+    synonym is left as written when the question names only other tables
+    (`tables`: the schema's table names).
+    """
+
+    def __init__(self, synonyms: dict, scopes: dict = None, tables=()):
+        self.synonyms = dict(synonyms)
+        self.scopes = dict(scopes or {})
+        variants = sorted(self.synonyms, key=len, reverse=True)
+        alternation = "|".join(r"\s+".join(map(re.escape, v.split())) for v in variants)
+        self.pattern = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE) if variants else None
+        # words naming a table: the table, its singular and single-word variants
+        tables = set(tables).union(*self.scopes.values())
+        self.table_words = {w: t for t in tables for w in (t, t.rstrip("s"))}
+        self.table_words.update({v: c for v, c in self.synonyms.items() if c in tables and " " not in v})
+
+    def _tables_named(self, text: str) -> set:
+        return {self.table_words[w] for w in re.findall(r"[a-z_]+", text.lower()) if w in self.table_words}
+
+    def normalize(self, text: str) -> str:
+        if not self.pattern:
+            return text
+        named = self._tables_named(text) if self.scopes else set()
+
+        def replace(match):
+            canonical = self.synonyms[" ".join(match.group(0).lower().split())]
+            tables = self.scopes.get(canonical)
+            if tables and named and not tables & named:
+                return match.group(0)             # another table's question: left for the LLM
+            return canonical
+
+        return self.pattern.sub(replace, text)
+
+    def normalize_many(self, texts) -> list:
+        return [self.normalize(t) for t in texts]
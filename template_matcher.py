@@ -0,0 +1,334 @@
+import os
+import re
+import threading
+import time
+
+from utils import DB_PATH, get_pool, get_schema_fingerprint
+from prompt_builder import get_schema_snapshot
+
+# ------------------- CONFIG ------------------- #
+TEMPLATE_MIN_CONFIDENCE = float(os.getenv("TEMPLATE_MIN_CONFIDENCE", "0.85"))
+VALUE_INDEX_TTL = 300                     # seconds before column values are re-read
+VALUE_INDEX_MAX_DISTINCT = 200            # columns with more distinct values are not indexed
+VALUE_INDEX_EXCLUDE_TABLES = {"users", "audit_log", "audit_log_archive"}
+SHORT_VALUE_LENGTH = 3                    # "IT", "HR": matched case-sensitively only
+
+# Not content words. "and" / "or" / "not" and bare numbers are: no template explains them
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "with", "all", "any",
+    "me", "my", "us", "we", "our", "show", "list", "give", "get", "find", "display", "fetch",
+    "what", "which", "who", "whose", "where", "are", "is", "was", "were", "be", "do", "does",
+    "have", "has", "there", "their", "that", "those", "these", "please", "every", "each",
+    "than", "from", "whole", "details", "info", "information", "data", "records", "rows",
+}
+COUNT_WORDS = re.compile(r"\b(?:how many|count|number of|total number of|no of)\b")
+GROUP_BY = re.compile(r"\b(?:per|by|for each|in each|each)\s+([a-z_]+)")
+COMPARATORS = {
+    ">=": ">=", "<=": "<=", ">": ">", "<": "<", "=": "=",
+    "greater than": ">", "more than": ">", "higher than": ">", "above": ">", "over": ">",
+    "less than": "<", "lower than": "<", "below": "<", "under": "<",
+    "at least": ">=", "at most": "<=", "equal to": "=", "equals": "=",
+}
+_COMPARATOR = "|".join(re.escape(c) for c in sorted(COMPARATORS, key=len, reverse=True))
+NUMERIC_FILTER = re.compile(rf"([a-z_]+)\s*(?:is\s+|of\s+)?({_COMPARATOR})\s*(\d+(?:\.\d+)?)")
+YEAR_FILTER = re.compile(r"([a-z_]+)\s+(after|since|before|in)\s+((?:19|20)\d{2})\b")
+
+
+def _quote(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# ------------------- COLUMN VALUE INDEX ------------------- #
+class ValueIndex:
+    """
+    Distinct values of low-cardinality text columns ("HR", "Overdue",
+    client names...), compiled into one regex for finding them in questions.
+    """
+
+    def __init__(self, values: dict):
+        self.values = values                    # lowercase value -> [(table, column, value)]
+        long_values = sorted((v for v in values if len(v) > SHORT_VALUE_LENGTH), key=len, reverse=True)
+        short_values = sorted({o for refs in values.values() for _, _, o in refs
+                               if len(o) <= SHORT_VALUE_LENGTH}, key=len, reverse=True)
+        self._long = self._compile(long_values, re.IGNORECASE)
+        self._short = self._compile(short_values, 0)
+
+    @staticmethod
+    def _compile(values, flags):
+        if not values:
+            return None
+        return re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, values)) + r")(?!\w)", flags)
+
+    @classmethod
+    def build(cls, conn, snapshot: dict):
+        values = {}
+        for table, info in snapshot.items():
+            if table in VALUE_INDEX_EXCLUDE_TABLES:
+                continue
+            types = {c[1]: (c[2] or "").upper() for c in conn.execute(f"PRAGMA table_info({table});")}
+            for column in info["columns"]:
+                if "CHAR" not in types.get(column, "") and "TEXT" not in types.get(column, ""):
+                    continue
+                if column.endswith("_id") and column != "job_id":
+                    continue
+                rows = conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL "
+                                    f"LIMIT {VALUE_INDEX_MAX_DISTINCT + 1};").fetchall()
+                if len(rows) > VALUE_INDEX_MAX_DISTINCT:
+                    continue
+                for (value,) in rows:
+                    if isinstance(value, str) and len(value.strip()) >= 2:
+                        values.setdefault(value.lower(), []).append((table, column, value))
+        return cls(values)
+
+    def find(self, question: str) -> list:
+        """[(start, end, [(table, column, value)])] for every value mentioned"""
+        found = []
+        for pattern in (self._long, self._short):
+            if pattern is None:
+                continue
+            for m in pattern.finditer(question):
+                if any(s < m.end() and m.start() < e for s, e, _ in found):
+                    continue
+                found.append((m.start(), m.end(), self.values[m.group(0).lower()]))
+        return sorted(found)
+
+
+# ------------------- TEMPLATE MATCHER ------------------- #
+class TemplateMatcher:
+    """
+    LLM-free SQL for common question shapes, built from the live schema:
+    - list   "list employees in HR with salary above 50000"
+    - count  "how many invoices are overdue"
+    - group  "count employees per department", "how many invoices by status"
+    Slots (column values, numeric thresholds, years) are filled from the
+    question; joins follow foreign keys. `confidence` is the share of the
+    question's content words the template explains; callers fall back to
+    the LLM below TEMPLATE_MIN_CONFIDENCE.
+    """
+
+    def __init__(self, db_path=DB_PATH, min_confidence=TEMPLATE_MIN_CONFIDENCE):
+        self.db_path = db_path
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._state = None                      # (fingerprint, built_at, snapshot, types, value index)
+
+    def _schema(self):
+        fingerprint = get_schema_fingerprint(self.db_path)
+        with self._lock:
+            state = self._state
+            if state and state[0] == fingerprint and time.monotonic() - state[1] < VALUE_INDEX_TTL:
+                return state[2:]
+        snapshot = {t: i for t, i in get_schema_snapshot(self.db_path).items()
+                    if t not in VALUE_INDEX_EXCLUDE_TABLES}
+        with get_pool(self.db_path).connection() as conn:
+            types = {t: {c[1]: (c[2] or "").upper() for c in conn.execute(f"PRAGMA table_info({t});")}
+                     for t in snapshot}
+            values = ValueIndex.build(conn, snapshot)
+        with self._lock:
+            self._state = (fingerprint, time.monotonic(), snapshot, types, values)
+        return snapshot, types, values
+
+    def refresh(self):
+        with self._lock:
+            self._state = None
+
+    # ---------------- helpers ----------------
+    @staticmethod
+    def _table_for_word(word: str, snapshot: dict):
+        for table in snapshot:
+            if word in (table, table.rstrip("s"), table + "s"):
+                return table
+        return None
+
+    @staticmethod
+    def _join(a: str, b: str, snapshot: dict):
+        """JOIN clauses from table a to table b (direct FK or one bridge table)"""
+        def direct(x, y):
+            for col, ref, ref_col in snapshot[x]["fks"]:
+                if ref == y:
+                    return f"JOIN {y} ON {x}.{col} = {y}.{ref_col}"
+            for col, ref, ref_col in snapshot[y]["fks"]:
+                if ref == x:
+                    return f"JOIN {y} ON {y}.{col} = {x}.{ref_col}"
+            return None
+
+        clause = direct(a, b)
+        if clause:
+            return [clause]
+        for bridge in snapshot:
+            if bridge in (a, b):
+                continue
+            first, second = direct(a, bridge), direct(bridge, b)
+            if first and second:
+                return [first, second]
+        return None
+
+    @staticmethod
+    def _label_column(table: str, snapshot: dict) -> str:
+        columns = snapshot[table]["columns"]
+        return next((c for c in columns if c.endswith("_name")), columns[0])
+
+    # ---------------- matching ----------------
+    def match(self, question: str):
+        """
+        {"sql", "confidence", "template", "slots"} for the best template, or
+        None if no table can be identified. Check `confidence` before use.
+        """
+        snapshot, types, value_index = self._schema()
+        original = question.strip().rstrip("?.!")
+        q = original.lower()
+        explained = set()
+
+        def mark(text):
+            explained.update(re.findall(r"[a-z0-9_&]+", text.lower()))
+
+        # slot: column values ("HR", "Overdue", client names)
+        value_hits = value_index.find(original)
+        for start, end, _ in value_hits:
+            mark(original[start:end])
+
+        # group by a table or a column
+        group = None
+        group_match = GROUP_BY.search(q)
+
+        # target table: first table named outside the GROUP BY phrase
+        target = None
+        for m in re.finditer(r"[a-z_]+", q):
+            table = self._table_for_word(m.group(0), snapshot)
+            if table is None:
+                continue
+            if group_match and group_match.start(1) <= m.start() < group_match.end(1):
+                continue
+            explained.add(m.group(0))
+            target = target or table
+
+        numeric = list(NUMERIC_FILTER.finditer(q))
+        years = list(YEAR_FILTER.finditer(q))
+
+        if target is None:
+            # infer from a numeric column ("salary over 50000") or a value ("overdue")
+            owners = {t for m in numeric for t, info in snapshot.items() if m.group(1) in info["columns"]}
+            owners |= {refs[0][0] for _, _, refs in value_hits if len({r[0] for r in refs}) == 1}
+            if len(owners) != 1:
+                return None
+            target = owners.pop()
+
+        conditions, joins, slots = [], [], {}
+        filter_spans = []                       # text used by filters, not projected
+
+        def reach(table):
+            """Make `table` reachable from the target; False if no join path"""
+            if table == target or any(f"JOIN {table} " in j for j in joins):
+                return True
+            path = self._join(target, table, snapshot)
+            if not path:
+                return False
+            joins.extend(j for j in path if j not in joins)
+            return True
+
+        penalty = 1.0
+        filtered = set()
+        for start, end, refs in value_hits:
+            candidates = [r for r in refs if r[0] == target] or \
+                         [r for r in refs if self._join(target, r[0], snapshot)]
+            if not candidates:
+                continue
+            if len({(t, c) for t, c, _ in candidates}) > 1:
+                penalty *= 0.9                  # same value in several columns
+            table, column, value = candidates[0]
+            if (table, column) in filtered:
+                return None                     # "HR or Sales": one column, several values
+            filtered.add((table, column))
+            reach(table)
+            conditions.append(f"{table}.{column} = {_quote(value)}")
+            slots[f"{table}.{column}"] = value
+            # "status overdue", "status is overdue": the column word names the filter
+            named = re.search(rf"\b{column}\s*(?:is\s+|=\s*)?$", q[:start])
+            if named:
+                mark(named.group(0))
+                filter_spans.append(named.span())
+
+        for m in numeric:
+            column, op, number = m.group(1), COMPARATORS[m.group(2)], m.group(3)
+            table = target if column in snapshot[target]["columns"] else next(
+                (t for t, info in snapshot.items() if column in info["columns"] and self._join(target, t, snapshot)),
+                None)
+            if table is None or not any(k in types[table].get(column, "") for k in ("INT", "REAL", "NUM")):
+                continue
+            reach(table)
+            conditions.append(f"{table}.{column} {op} {number}")
+            slots[f"{table}.{column}"] = f"{op} {number}"
+            mark(m.group(0))
+            filter_spans.append(m.span())
+
+        for m in years:
+            stem = m.group(1)[:4]
+            date_columns = [c for c in snapshot[target]["columns"] if "DATE" in types[target].get(c, "")]
+            column = next((c for c in date_columns if c.startswith(stem)), None)
+            if column is None:
+                continue
+            year, word = int(m.group(3)), m.group(2)
+            if word == "after":
+                conditions.append(f"{target}.{column} >= '{year + 1}-01-01'")
+            elif word == "since":
+                conditions.append(f"{target}.{column} >= '{year}-01-01'")
+            elif word == "before":
+                conditions.append(f"{target}.{column} < '{year}-01-01'")
+            else:
+                conditions.append(f"{target}.{column} BETWEEN '{year}-01-01' AND '{year}-12-31'")
+            slots[f"{target}.{column}"] = f"{word} {year}"
+            mark(m.group(0))
+            filter_spans.append(m.span())
+
+        # intent
+        counting = bool(COUNT_WORDS.search(q))
+        if counting:
+            mark(COUNT_WORDS.search(q).group(0))
+        if group_match and counting:           # "employees by department" is a list, not a count
+            word = group_match.group(1)
+            group_table = self._table_for_word(word, snapshot)
+            if group_table and group_table != target and reach(group_table):
+                group = f"{group_table}.{self._label_column(group_table, snapshot)}"
+            elif word in snapshot[target]["columns"]:
+                group = f"{target}.{word}"
+            if group:
+                mark(group_match.group(0))
+
+        # projected columns: named columns of the target, else everything
+        projected = "".join(" " if any(s <= i < e for s, e in filter_spans) else ch for i, ch in enumerate(q))
+        columns = [c for c in snapshot[target]["columns"] if re.search(rf"\b{c}\b", projected)]
+        if re.search(r"\bnames?\b", projected):
+            columns += [c for c in snapshot[target]["columns"] if c.endswith("name") and c not in columns]
+            explained.update({"name", "names"})
+        mark(" ".join(columns))
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        join_sql = "".join(f" {j}" for j in joins)
+        if group:
+            template = "count_by_group"
+            sql = (f"SELECT {group}, COUNT(*) AS count FROM {target}{join_sql}{where} "
+                   f"GROUP BY {group} ORDER BY count DESC;")
+        elif counting:
+            template = "count"
+            sql = f"SELECT COUNT(*) AS count FROM {target}{join_sql}{where};"
+        else:
+            template = "list"
+            projection = ", ".join(f"{target}.{c}" for c in columns) if columns else f"{target}.*"
+            sql = f"SELECT {projection} FROM {target}{join_sql}{where};"
+
+        content = [w for w in re.findall(r"[a-z0-9_&]+", q) if w not in STOPWORDS]
+        confidence = (sum(1 for w in content if w in explained) / len(content) if content else 0.0) * penalty
+        return {"sql": sql, "confidence": round(confidence, 3), "template": template, "slots": slots}
+
+    def answer(self, question: str):
+        """match() if confident enough, else None"""
+        try:
+            result = self.match(question)
+        except Exception:
+            return None
+        if result and result["confidence"] >= self.min_confidence:
+            return result
+        return None
+
+
+template_matcher = TemplateMatcher()
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+from groq import Groq
+
+import model_router
+from llm_stub import StubLLMServer
+from model_router import CircuitBreaker, ModelRouter, SMALL_MODEL, LARGE_MODEL
+
+
+@pytest.fixture
+def stub():
+    server = StubLLMServer().start()
+    yield server
+    server.stop()
+
+
+def make_router(stub, **kwargs):
+    client = Groq(api_key="stub", base_url=stub.base_url, max_retries=0)
+    return ModelRouter(client, routing=False, **kwargs)          # always the large model first
+
+
+def test_hedge_fires_after_delay(stub, monkeypatch):
+    monkeypatch.setattr(model_router, "HEDGE_DEFAULT_DELAY", 0.1)
+    seen = []
+    stub.latency = lambda model: seen.append(model) or (1.0 if len(seen) == 1 else 0.0)
+    router = make_router(stub)
+
+    completion = router.complete("list employees")
+
+    assert completion["hedged"] and completion["model"] == LARGE_MODEL
+    assert completion["elapsed_ms"] < 1000                       # the duplicate answered first
+    assert router.counters["hedges"] == 1 and router.counters["hedge_wins"] == 1
+    assert len(stub.requests) == 2
+
+
+def test_jittered_retry_after_transient_error(stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(model_router.random, "uniform", lambda low, high: delays.append((low, high)) or 0.0)
+    stub.fail_models = {LARGE_MODEL}
+
+    def recover(model):                    # only the first request fails
+        if len(stub.requests) > 1:
+            stub.fail_models.clear()
+        return 0.0
+
+    stub.latency = recover
+    router = make_router(stub)
+
+    completion = router.complete("list employees")
+
+    assert completion["model"] == LARGE_MODEL and completion["attempts"] == 2
+    assert router.counters["retries"] == 1 and router.counters["fallbacks"] == 0
+    assert delays == [(0, model_router.RETRY_BASE_DELAY)]       # full jitter up to the base delay
+
+
+def test_breaker_opens_half_opens_and_closes(stub, monkeypatch):
+    monkeypatch.setattr(model_router.random, "uniform", lambda low, high: 0.0)
+    breakers = {SMALL_MODEL: CircuitBreaker(), LARGE_MODEL: CircuitBreaker(failures=2, cooldown=0.2)}
+    router = make_router(stub, max_retries=1, breakers=breakers)
+    breaker = breakers[LARGE_MODEL]
+    states = []
+
+    def observe(model):                    # breaker state while each request is in flight
+        states.append((model, breaker.state))
+        return 0.0
+
+    stub.latency = observe
+    stub.fail_models = {LARGE_MODEL}
+
+    assert router.complete("list employees")["model"] == SMALL_MODEL      # 2 failures, then fallback
+    assert breaker.state == "open" and breaker.trips == 1
+
+    stub.fail_models.clear()
+    states.clear()
+    assert router.complete("list employees")["model"] == SMALL_MODEL      # open: large model not called
+    assert states == [(SMALL_MODEL, "open")]
+
+    time.sleep(0.25)
+    states.clear()
+    assert router.complete("list employees")["model"] == LARGE_MODEL      # one trial call gets through
+    assert states == [(LARGE_MODEL, "half_open")]
+    assert breaker.state == "closed"
@@ -0,0 +1,47 @@
+import pytest
+
+from utils import StreamingSQLExtractor, extract_sql_from_llm
+
+
+def stream(text, size=3):
+    """Feed `text` in `size`-char chunks; (first statement returned by feed(), finish())"""
+    extractor = StreamingSQLExtractor()
+    early = None
+    for i in range(0, len(text), size):
+        early = early or extractor.feed(text[i:i + size])
+    return early, extractor.finish()
+
+
+@pytest.mark.parametrize("text", [
+    "I'll select the matching rows; here it is:\n```sql\nSELECT * FROM employees;\n```",
+    "To update you: the query is below.\n```sql\nSELECT * FROM employees;\n```",
+    "Select the rows you need:\n```sql\nSELECT * FROM employees;\n```",
+    "Select the rows you need; the query:\n```sql\nSELECT * FROM employees;\n```",
+    "Update: here it is; as requested.\n```sql\nSELECT * FROM employees;\n```",
+    "Select employees; that is the table.\n```sql\nSELECT * FROM employees;\n```",
+])
+def test_chatty_keyword_before_fence(text):
+    early, final = stream(text)
+    assert early == final == "SELECT * FROM employees;" == extract_sql_from_llm(text)
+
+
+@pytest.mark.parametrize("size", [1, 3, 7])
+def test_fence_split_across_chunks(size):
+    text = "Here you go:\n```sql\nSELECT name FROM employees WHERE dept = 'a;b'\n```\nDone."
+    early, final = stream(text, size)
+    assert early == final == "SELECT name FROM employees WHERE dept = 'a;b'"
+
+
+def test_unfenced_statement_at_line_start():
+    early, final = stream("SELECT * FROM departments;\nThis lists every department.")
+    assert early == final == "SELECT * FROM departments;"
+
+
+def test_unfenced_statement_after_prose():
+    early, final = stream("Select the rows you need; then:\nDELETE FROM projects WHERE project_id = 3;\n")
+    assert early == final == "DELETE FROM projects WHERE project_id = 3;"
+
+
+def test_plain_fence():
+    early, _ = stream("Query:\n```\nSELECT id FROM employees\n```")
+    assert early == "SELECT id FROM employees"
@@ -0,0 +1,35 @@
+import shutil
+
+import pytest
+
+from template_matcher import TemplateMatcher
+
+
+@pytest.fixture(scope="module")
+def matcher(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp("db") / "company.db"
+    shutil.copy("company.db", db_path)
+    return TemplateMatcher(db_path=str(db_path))
+
+
+@pytest.mark.parametrize("question", [
+    "list employees in HR or Sales",          # disjunction, not two AND-ed equalities
+    "list employees in HR and Sales",
+    "list employees not in HR",
+    "list 10 employees in HR",                # the 10 would be ignored
+    "list employees by department",           # a list, not a count per department
+])
+def test_unexplained_questions_go_to_the_llm(matcher, question):
+    assert matcher.answer(question) is None
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("how many employees by department",
+     "SELECT departments.department_name, COUNT(*) AS count FROM employees "
+     "JOIN departments ON employees.department_id = departments.department_id "
+     "GROUP BY departments.department_name ORDER BY count DESC;"),
+    ("list invoices with status overdue", "SELECT invoices.* FROM invoices WHERE invoices.status = 'Overdue';"),
+    ("how many invoices are overdue", "SELECT COUNT(*) AS count FROM invoices WHERE invoices.status = 'Overdue';"),
+])
+def test_template_answers(matcher, question, sql):
+    assert matcher.answer(question)["sql"] == sql
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# ------------------- CONFIG ------------------- #
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_WINDOW = 1000                       # recent samples kept per metric (rolling percentiles)
+TRACE_KEEP = 50                           # recent request traces kept for the metrics screen
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "sql_agent"
+
+# Stages, in pipeline order (anything else is listed after them)
+STAGES = ["normalize", "translation_cache", "template", "prompt_build", "llm_first_token", "llm",
+          "extract_sql", "sql_plan", "sql_execute", "audit_write", "render_dataframe"]
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+# ------------------- HISTOGRAM ------------------- #
+class RollingHistogram:
+    """Last `window` observations plus lifetime count / sum"""
+
+    def __init__(self, window=TRACE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float, ordered=None):
+        ordered = sorted(self.samples) if ordered is None else ordered
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        result = {"count": self.count, "sum": round(self.total, 3)}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = round(self.quantile(q, ordered), 3) if ordered else None
+        result["max"] = round(ordered[-1], 3) if ordered else None
+        return result
+
+
+# ------------------- TRACER ------------------- #
+class Tracer:
+    """
+    Process-wide spans and metrics:
+    - span(stage) times a block into the stage's latency histogram (ms)
+      and, inside trace(), into that request's span list
+    - observe(metric, value) feeds value histograms (tokens, rows)
+    - to_json() / to_prometheus() export everything
+    The context variable follows asyncio tasks and asyncio.to_thread.
+    """
+
+    def __init__(self, window=TRACE_WINDOW, keep=TRACE_KEEP, enabled=TRACING_ENABLED):
+        self.window = window
+        self.enabled = enabled
+        self.latency = {}                 # stage -> RollingHistogram (ms)
+        self.values = {}                  # metric -> RollingHistogram
+        self.traces = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def _histogram(self, family: dict, name: str) -> RollingHistogram:
+        if name not in family:
+            family[name] = RollingHistogram(self.window)
+        return family[name]
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Root of one request (its total time is the `name` stage); nested spans are attached to it"""
+        if not self.enabled or _current.get() is not None:
+            yield _current.get()
+            return
+        record = {"name": name, "start": time.time(), "attrs": dict(attrs), "spans": []}
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:            # generator closed from another context
+                _current.set(None)
+            record["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            with self._lock:
+                self._histogram(self.latency, name).observe(record["total_ms"])
+                self.traces.append(record)
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000, **attrs)
+
+    def record(self, stage: str, elapsed_ms: float, **attrs):
+        """Add an already measured stage duration"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(self.latency, stage).observe(elapsed_ms)
+        current = _current.get()
+        if current is not None:
+            current["spans"].append({"stage": stage, "ms": round(elapsed_ms, 3), **attrs})
+
+    def observe(self, metric: str, value):
+        """Record a non-latency value (token counts, rows returned)"""
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            self._histogram(self.values, metric).observe(float(value))
+        current = _current.get()
+        if current is not None:
+            current["attrs"][metric] = current["attrs"].get(metric, 0) + value
+
+    def observe_usage(self, usage):
+        """prompt / completion token counts from a Groq (OpenAI-style) usage object"""
+        if usage is None:
+            return
+        self.observe("prompt_tokens", getattr(usage, "prompt_tokens", None))
+        self.observe("completion_tokens", getattr(usage, "completion_tokens", None))
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.values.clear()
+            self.traces.clear()
+
+    # ---------------- export ----------------
+    def snapshot(self) -> dict:
+        with self._lock:
+            order = {stage: i for i, stage in enumerate(STAGES)}
+            latency = sorted(self.latency.items(), key=lambda kv: (order.get(kv[0], len(order)), kv[0]))
+            return {
+                "latency_ms": {stage: h.summary() for stage, h in latency},
+                "values": {metric: h.summary() for metric, h in sorted(self.values.items())},
+                "traces": list(self.traces),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps({"generated_at": time.time(), **self.snapshot()}, default=str, indent=2)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition: one summary per family, labelled by stage / metric"""
+        snapshot = self.snapshot()
+        lines = []
+        for family, label, series in (("stage_latency_ms", "stage", snapshot["latency_ms"]),
+                                      ("value", "metric", snapshot["values"])):
+            name = f"{METRIC_PREFIX}_{family}"
+            lines.append(f"# TYPE {name} summary")
+            for key, summary in series.items():
+                for q in QUANTILES:
+                    value = summary[f"p{round(q * 100)}"]
+                    if value is not None:
+                        lines.append(f'{name}{{{label}="{key}",quantile="{q}"}} {value}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {summary["sum"]}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()
@@ -1,13 +1,20 @@
 import sqlite3
-import difflib
 import re
 import os
-import shutil
 import time
 import hashlib
+import json
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
 import pyotp      # MFA
 import jwt        # JWT session tokens
-from functools import lru_cache
+import zstandard as zstd
+from cache import ResultCache
+from schema_index import SchemaIndex
+from query_guard import QUERY_TIMEOUT, add_default_limit, check_plan, query_budget, strip_terminator
+from tracing import tracer
 
 # ------------------- CONFIG ------------------- #
 DB_PATH = "company.db"
@@ -15,43 +22,308 @@ BACKUP_DIR = "backups"
 SECRET_KEY = "supersecretkey123"     # change in production
 ALGORITHM = "HS256"
 
+# Connection pool settings
+MAX_RESULT_ROWS = 10000             # hard cap on rows returned by one query
+PAGE_SIZE = 100                      # rows per page in paginated results
+BACKUP_PAGES_PER_STEP = 1024        # pages copied per backup step
+BACKUP_STEP_SLEEP = 0.005            # seconds between steps, lets writers in
+BACKUP_CHUNK_SIZE = 1024 * 1024      # bytes per compression / hashing read
+BACKUP_ZSTD_LEVEL = 3
+POOL_MAX_CONNECTIONS = 8
+POOL_TIMEOUT = 30                    # seconds to wait for a free connection
+AUTO_CORRECT_SQL = False             # retry statements with misspelled names, corrected
+AUDIT_BATCH_SIZE = 500               # audit events written per transaction
+AUDIT_FLUSH_INTERVAL = 1.0           # seconds an event may wait in the buffer
+AUDIT_QUEUE_SIZE = 10000             # buffered events before callers block
+AUDIT_PUT_TIMEOUT = 1.0              # seconds a caller blocks on a full buffer
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",         # safe with WAL, one fsync per checkpoint
+    "cache_size": -64000,            # ~64 MB page cache per connection
+    "mmap_size": 268435456,          # 256 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+# ------------------- CONNECTION POOL ------------------- #
+class ConnectionPool:
+    """
+    Reusable SQLite connections for one database file:
+    - WAL journal mode + tuned PRAGMAs applied once per connection
+    - Nested use in the same thread shares one connection
+    - At most `max_connections` open, extra callers wait
+    """
+
+    def __init__(self, db_path=DB_PATH, max_connections=POOL_MAX_CONNECTIONS,
+                 timeout=POOL_TIMEOUT, pragmas=None):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value};")
+        return conn
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._open < self.max_connections
+            if can_open:
+                self._open += 1
+                self._misses += 1
+            else:
+                self._waits += 1
+
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled database connection")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; nested calls in the same thread reuse it"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.depth += 1
+            with self._lock:
+                self._hits += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            try:
+                self._release(conn)
+            except Exception:
+                self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._open -= 1
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones close when returned)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "db_path": self.db_path,
+                "open": self._open,
+                "idle": self._idle.qsize(),
+                "max": self.max_connections,
+                "hits": self._hits,
+                "misses": self._misses,
+                "waits": self._waits,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH) -> ConnectionPool:
+    """Shared pool for a database file (one per absolute path)"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+
+def get_pool_stats():
+    """Stats for every open pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
+
+
 # ------------------- DB SCHEMA ------------------- #
 def get_db_schema(db_path=DB_PATH):
     """Fetch schema info for all tables"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    with get_pool(db_path).connection() as conn:
+        cursor = conn.cursor()
 
-    schema = ""
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+        schema = ""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = cursor.fetchall()
 
-    for t in tables:
-        tname = t[0]
-        cursor.execute(f"PRAGMA table_info({tname});")
-        cols = cursor.fetchall()
-        schema += f"\nTable: {tname}\n"
-        schema += ", ".join([f"{c[1]} ({c[2]})" for c in cols]) + "\n"
+        for t in tables:
+            tname = t[0]
+            cursor.execute(f"PRAGMA table_info({tname});")
+            cols = cursor.fetchall()
+            schema += f"\nTable: {tname}\n"
+            schema += ", ".join([f"{c[1]} ({c[2]})" for c in cols]) + "\n"
 
-    conn.close()
     return schema
 
 
-# ------------------- MAIN SQL EXECUTION ------------------- #
-@lru_cache(maxsize=50)
-def cached_query(query: str):
-    """Cached SELECT queries"""
-    return execute_sql_query(query)
+_schema_fingerprints = {}
+
+
+def get_schema_fingerprint(db_path=DB_PATH) -> str:
+    """Hash of the live schema; recomputed only when PRAGMA schema_version changes"""
+    key = os.path.abspath(db_path)
+    with get_pool(db_path).connection() as conn:
+        version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+        cached = _schema_fingerprints.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        rows = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master ORDER BY type, name;"
+        ).fetchall()
+
+    fingerprint = hashlib.sha256(repr(rows).encode()).hexdigest()
+    _schema_fingerprints[key] = (version, fingerprint)
+    return fingerprint
+
+
+_schema_indexes = {}
+
 
+def get_schema_index(db_path=DB_PATH) -> SchemaIndex:
+    """Identifier index of the live schema, rebuilt when the fingerprint changes"""
+    key = os.path.abspath(db_path)
+    fingerprint = get_schema_fingerprint(db_path)
+    cached = _schema_indexes.get(key)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+    with get_pool(db_path).connection() as conn:
+        index = SchemaIndex.from_connection(conn)
+    _schema_indexes[key] = (fingerprint, index)
+    return index
 
-def execute_sql_query(query: str, db_path=DB_PATH, user="system"):
+
+# ------------------- TABLE DEPENDENCIES ------------------- #
+result_cache = ResultCache()
+
+_READ_OPCODES = ("OpenRead",)
+_WRITE_OPCODES = ("OpenWrite", "Clear")
+_statement_tables = {}
+_STATEMENT_TABLES_MAX = 4096
+_NON_DETERMINISTIC = re.compile(
+    r"\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\(|'now'"
+    r"|\bcurrent_(date|time|timestamp)\b"
+    r"|\b(date|time|datetime|julianday|unixepoch)\s*\(\s*\)"       # no time value: now
+    r"|\bstrftime\s*\(\s*'[^']*'\s*\)",
+    re.IGNORECASE
+)
+
+_data_versions = {}                       # db -> (watcher connection, last PRAGMA data_version)
+_data_versions_lock = threading.Lock()
+
+
+def drop_stale_results(cache_db: str):
+    """
+    Clear cached results of `cache_db` if another connection committed since
+    the last check. PRAGMA data_version on a connection that never writes
+    sees commits from every other connection, including other processes
+    (service, batch, other app sessions), which invalidate_tables never hears of.
+    """
+    with _data_versions_lock:
+        watcher, last = _data_versions.get(cache_db, (None, None))
+        if watcher is None:
+            watcher = sqlite3.connect(cache_db, check_same_thread=False)
+        version = watcher.execute("PRAGMA data_version;").fetchone()[0]
+        _data_versions[cache_db] = (watcher, version)
+    if last is not None and version != last:
+        result_cache.clear(cache_db)
+
+
+def get_statement_tables(conn, query: str, db_path=DB_PATH):
+    """
+    (read_tables, written_tables) for a statement, taken from the
+    root pages its EXPLAIN bytecode opens (indexes map to their table).
+    """
+    version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+    key = (os.path.abspath(db_path), version, query)
+    if key in _statement_tables:
+        return _statement_tables[key]
+
+    roots = dict(conn.execute(
+        "SELECT rootpage, tbl_name FROM sqlite_master WHERE rootpage > 0;"
+    ).fetchall())
+
+    reads, writes = set(), set()
+    for _addr, opcode, _p1, p2, *_rest in conn.execute(f"EXPLAIN {query}"):
+        if opcode in _READ_OPCODES or opcode in _WRITE_OPCODES:
+            # OpenRead/OpenWrite keep the root page in p2, Clear in p1
+            table = roots.get(_p1 if opcode == "Clear" else p2)
+            if table is None or table.startswith("sqlite_"):
+                continue
+            (reads if opcode in _READ_OPCODES else writes).add(table.lower())
+
+    if len(_statement_tables) >= _STATEMENT_TABLES_MAX:
+        _statement_tables.clear()
+    _statement_tables[key] = (frozenset(reads), frozenset(writes))
+    return _statement_tables[key]
+
+
+# ------------------- MAIN SQL EXECUTION ------------------- #
+def execute_sql_query(query: str, db_path=DB_PATH, user="system", max_rows=MAX_RESULT_ROWS,
+                      auto_correct=AUTO_CORRECT_SQL, timeout=QUERY_TIMEOUT):
     """
     Execute SQL safely with:
     - Allowed commands only
-    - Fuzzy matching help
-    - Audit logging
-    - Returns dict always
+    - Runaway-query guard: plans estimated too expensive are refused,
+      SELECTs get an automatic LIMIT, statements past `timeout` seconds or
+      the VM-step budget are interrupted ("error_type", "elapsed_ms")
+    - Misspelled table/column names mapped to real ones ("suggestions");
+      with auto_correct the corrected statement is run instead
+    - Audit logging (buffered, with affected table and rowcount)
+    - SELECT results cached until a write touches their tables
+    - At most `max_rows` rows fetched ("truncated" set when more exist)
+    - Returns dict always (columns, rows, rowcount, truncated, elapsed_ms)
     """
     allowed_keywords = ("SELECT", "INSERT", "UPDATE", "DELETE")
     keyword = query.strip().split()[0].upper()
@@ -59,48 +331,157 @@ def execute_sql_query(query: str, db_path=DB_PATH, user="system"):
     if keyword not in allowed_keywords:
         return {"error": "Only SELECT, INSERT, UPDATE, DELETE queries are allowed."}
 
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(query)
-        except sqlite3.OperationalError as e:
-            error_message = str(e)
-
-            # Attempt fuzzy matching suggestions
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = [t[0] for t in cursor.fetchall()]
-
-            suggestions = {}
-            for table in tables:
-                cursor.execute(f"PRAGMA table_info({table});")
-                columns = [col[1] for col in cursor.fetchall()]
-                matches = difflib.get_close_matches(query, columns, n=2, cutoff=0.6)
-                if matches:
-                    suggestions[table] = matches
-
+    start = time.perf_counter()
+    cache_db = os.path.abspath(db_path)
+    cacheable = keyword == "SELECT" and not _NON_DETERMINISTIC.search(query)
+    if cacheable:
+        drop_stale_results(cache_db)
+        cached = result_cache.get(cache_db, (query, max_rows))
+        if cached is not None:
+            cols, rows = cached
+            tracer.observe("rows", min(len(rows), max_rows))
             return {
-                "error": error_message,
-                "suggestions": suggestions if suggestions else None
+                "columns": cols,
+                "rows": list(rows[:max_rows]),
+                "rowcount": min(len(rows), max_rows),
+                "truncated": len(rows) > max_rows,
+                "cached": True,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
             }
+    generation = result_cache.generation
 
-        rows = cursor.fetchall()
-        cols = [desc[0] for desc in cursor.description] if cursor.description else []
-        conn.commit()
-
-        # Log non-select actions
-        if keyword in ("INSERT", "UPDATE", "DELETE"):
-            log_db_action(user, keyword, "unknown", "N/A", f"Query: {query}")
-
-        conn.close()
-
-        return {"columns": cols, "rows": rows}
+    try:
+        with get_pool(db_path).connection() as conn:
+            cursor = conn.cursor()
+            # SELECTs without LIMIT stop after the rows we would fetch anyway
+            statement = add_default_limit(query, max_rows + 1) if keyword == "SELECT" else query
+            budget = None
+
+            try:
+                with tracer.span("sql_plan"):
+                    plan = check_plan(conn, statement)
+                if not plan["allowed"]:
+                    return {
+                        "error": f"Query refused: {plan['reason']}.",
+                        "error_type": "too_expensive",
+                        "estimated_cost": plan["cost"],
+                        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+                    }
+                with tracer.span("sql_execute"), query_budget(conn, timeout) as budget:
+                    cursor.execute(statement)
+                    # fetch one extra row to detect truncation without reading the rest
+                    fetched = cursor.fetchmany(max_rows + 1) if cursor.description else []
+            except sqlite3.OperationalError as e:
+                if budget is not None and budget.reason:
+                    return budget.error()
+                error_message = str(e)
+                if "no such column" not in error_message and "no such table" not in error_message:
+                    return {"error": error_message, "suggestions": None}
+
+                # Map unknown identifiers to the closest real table/column
+                fix = get_schema_index(db_path).correct(query)
+                if fix["corrections"] and auto_correct:
+                    result = execute_sql_query(fix["sql"], db_path, user, max_rows, auto_correct=False,
+                                               timeout=timeout)
+                    if "error" not in result:
+                        result["corrected_sql"] = fix["sql"]
+                        result["corrections"] = fix["corrections"]
+                        return result
+
+                return {
+                    "error": error_message,
+                    "suggestions": fix["corrections"] or None,
+                    "corrected_sql": fix["sql"] if fix["corrections"] else None
+                }
+
+            truncated = len(fetched) > max_rows
+            rows = fetched[:max_rows]
+            cols = [desc[0] for desc in cursor.description] if cursor.description else []
+            rowcount = len(rows) if cols else cursor.rowcount
+
+            audit = None
+            if keyword in ("INSERT", "UPDATE", "DELETE"):
+                _, write_tables = get_statement_tables(conn, query, db_path)
+                audit = (keyword, _audit_table(write_tables), _audit_record_id(query, keyword, cursor),
+                         json.dumps({"query": query, "rowcount": rowcount}))
+
+            conn.commit()
+
+            if cacheable:
+                read_tables, _ = get_statement_tables(conn, query, db_path)
+                result_cache.put(cache_db, (query, max_rows), cols, fetched, read_tables, generation)
+            elif audit:
+                result_cache.invalidate_tables(cache_db, write_tables)
+
+        # Audit non-select actions through the buffered writer (no extra commit here)
+        if audit:
+            log_db_action(user, *audit, db_path=db_path)
+
+        if cols:
+            tracer.observe("rows", rowcount)
+        return {
+            "columns": cols,
+            "rows": rows,
+            "rowcount": rowcount,
+            "truncated": truncated,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
 
     except Exception as e:
         return {"error": str(e)}
 
 
+# ------------------- STREAMING / PAGINATION ------------------- #
+def iter_sql_query(query: str, db_path=DB_PATH, page_size=PAGE_SIZE, max_rows=MAX_RESULT_ROWS):
+    """
+    Stream a SELECT as fixed-size pages of rows (cursor-backed, fetchmany).
+    Yields {"columns", "rows", "page"}; stops after `max_rows` rows and
+    marks the last page "truncated" if more rows were available.
+    """
+    if query.strip().split()[0].upper() != "SELECT":
+        raise ValueError("Only SELECT queries can be streamed.")
+
+    with get_pool(db_path).connection() as conn:
+        with query_budget(conn):
+            cursor = conn.execute(query)
+        cols = [desc[0] for desc in cursor.description]
+        fetched = 0
+        page = 0
+        while fetched < max_rows:
+            with query_budget(conn):            # per page: time spent by the consumer is not counted
+                rows = cursor.fetchmany(min(page_size, max_rows - fetched))
+            if not rows:
+                return
+            fetched += len(rows)
+            truncated = fetched >= max_rows and cursor.fetchone() is not None
+            yield {"columns": cols, "rows": rows, "page": page, "truncated": truncated}
+            page += 1
+
+
+def fetch_result_page(query: str, page=0, page_size=PAGE_SIZE, db_path=DB_PATH, user="system",
+                      auto_correct=AUTO_CORRECT_SQL):
+    """
+    One page of a SELECT result (LIMIT/OFFSET around the statement), so
+    callers can render page by page without holding the full result.
+    Returns the execute_sql_query dict plus "page", "page_size", "has_next".
+    """
+    if query.strip().split()[0].upper() != "SELECT":
+        return execute_sql_query(query, db_path=db_path, user=user, auto_correct=auto_correct)
+
+    # the statement on its own lines, so a trailing -- comment can't swallow the ")"
+    paged = (f"SELECT * FROM (\n{strip_terminator(query)}\n) "
+             f"LIMIT {int(page_size) + 1} OFFSET {int(page) * int(page_size)}")
+    result = execute_sql_query(paged, db_path=db_path, user=user, max_rows=page_size,
+                               auto_correct=auto_correct)
+    if result.get("corrected_sql"):           # report the fix on the caller's statement
+        result["corrected_sql"] = get_schema_index(db_path).correct(query)["sql"]
+    if "error" not in result:
+        result["page"] = page
+        result["page_size"] = page_size
+        result["has_next"] = result.pop("truncated", False)
+    return result
+
+
 # ------------------- LLM SQL EXTRACTION ------------------- #
 def extract_sql_from_llm(llm_output: str) -> str:
     """Extract SQL query from LLM response"""
@@ -115,41 +496,489 @@ def extract_sql_from_llm(llm_output: str) -> str:
     return llm_output.strip()
 
 
+# keyword at the start of a line, with at least one character after it (not a prefix of a longer word)
+_SQL_LINE_START = re.compile(r"^[ \t]*(SELECT|INSERT|UPDATE|DELETE)\b(?=.)", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+
+def _is_sql_statement(text: str) -> bool:
+    """Complete and syntactically valid SQL ("Select the rows you need;" is not)"""
+    if not sqlite3.complete_statement(text):
+        return False
+    conn = sqlite3.connect(":memory:")        # empty schema: only unknown tables may fail
+    try:
+        conn.execute(f"EXPLAIN {text}")
+    except sqlite3.Error as e:
+        return str(e).startswith(("no such table", "no such function"))
+    finally:
+        conn.close()
+    return True
+
+
+class StreamingSQLExtractor:
+    """
+    Incremental extract_sql_from_llm for token streams: feed() returns the
+    SQL statement as soon as its terminating ';' or closing ``` arrives,
+    without waiting for the rest of the completion.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.sql = None
+        self._start = None        # index where the statement starts
+        self._fenced = False
+        self._scan = 0            # scan position inside the statement
+        self._quote = None
+        self._skip = 0            # text before this was rejected as prose
+
+    def feed(self, chunk: str):
+        """Add a chunk; returns the statement the first time it is complete"""
+        if self.sql is not None or not chunk:
+            return None
+        self.buffer += chunk
+
+        if self._start is not None and not self._fenced and "```" in self.buffer[self._start:]:
+            self._start = self._quote = None      # a fence follows: the statement is inside it
+        while True:
+            if self._start is None and not self._find_start():
+                return None
+            end = self._find_end()
+            if end is None:
+                return None
+            sql = self.buffer[self._start:end].strip()
+            # an unfenced statement has to parse; otherwise it is prose and the search goes on
+            if self._fenced or _is_sql_statement(sql):
+                self.sql = sql
+                return sql
+            self._skip, self._start, self._quote = end, None, None
+
+    def finish(self) -> str:
+        """Statement found so far, or the regular extraction of the full output"""
+        if self.sql is None:
+            self.sql = extract_sql_from_llm(self.buffer)
+        return self.sql
+
+    def _find_start(self) -> bool:
+        """
+        Same preference as extract_sql_from_llm: a ```sql fence always wins.
+        A bare keyword only counts at the start of a line, inside a plain
+        ``` fence or, with no fence seen yet, in unfenced output.
+        """
+        fence = re.search(r"```sql", self.buffer, re.IGNORECASE)
+        if fence:
+            self._fenced = True
+            self._start = fence.end()
+        elif "```" in self.buffer:
+            # ``` fence without a language tag (or "```sql" still arriving)
+            keyword = _SQL_LINE_START.search(self.buffer, max(self.buffer.index("```") + 3, self._skip))
+            if not keyword:
+                return False
+            self._fenced = True
+            self._start = keyword.start(1)
+        else:
+            keyword = _SQL_LINE_START.search(self.buffer, self._skip)
+            if not keyword:
+                return False
+            self._start = keyword.start(1)
+        self._scan = self._start
+        return True
+
+    def _find_end(self):
+        text = self.buffer
+        i = self._scan
+        while i < len(text):
+            ch = text[i]
+            if self._quote:
+                if ch == self._quote:
+                    self._quote = None
+            elif ch in ("'", '"'):
+                self._quote = ch
+            elif ch == ";":
+                return i + 1
+            elif self._fenced and text.startswith("```", i):
+                return i
+            elif self._fenced and ch == "`" and len(text) - i < 3:
+                break                  # possible fence split across chunks
+            i += 1
+        self._scan = i
+        return None
+
+
 # ------------------- AUDIT LOG ------------------- #
+_AUDIT_INSERT = """
+    INSERT INTO audit_log (user, action, table_name, record_id, details, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_WHERE_KEY = re.compile(r"\bwhere\s+(?:\w+\.)?(?:\w+_)?id\b\s*=\s*'?([\w-]+)'?\s*;?\s*$", re.IGNORECASE)
+
+
+def _audit_table(write_tables) -> str:
+    """Affected user table(s) of a statement, without SQLite internals"""
+    return ",".join(sorted(t for t in write_tables if not t.startswith("sqlite_"))) or "unknown"
+
+
+def _audit_record_id(query: str, keyword: str, cursor) -> str:
+    """New rowid for single-row INSERTs, the key for `WHERE ...id = x`, else empty"""
+    if keyword == "INSERT" and cursor.rowcount == 1 and cursor.lastrowid:
+        return str(cursor.lastrowid)
+    match = _WHERE_KEY.search(query)
+    return match.group(1) if match else ""
+
+
+class AuditWriter:
+    """
+    Buffered audit_log writer for one database:
+    - events are queued in memory and written by a background thread with
+      executemany, one transaction per batch
+    - a batch is flushed at `batch_size` events or `flush_interval` seconds
+    - when the queue is full callers block up to `put_timeout`, then flush
+      in their own thread (back-pressure instead of unbounded memory)
+    - flushed on interpreter shutdown
+    Events are timestamped when logged, not when written.
+    """
+
+    def __init__(self, db_path=DB_PATH, batch_size=AUDIT_BATCH_SIZE, flush_interval=AUDIT_FLUSH_INTERVAL,
+                 max_queue=AUDIT_QUEUE_SIZE, put_timeout=AUDIT_PUT_TIMEOUT):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self._thread.start()
+
+    def log(self, user, action, table_name, record_id="", details=""):
+        event = (user, action, table_name, str(record_id), details,
+                 time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()))
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+            return
+        except queue.Full:
+            self.blocked += 1
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            self.flush()
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                print(f"[AUDIT ERROR] buffer full, event dropped: {action} {table_name}")
+
+    def _take(self, timeout: float) -> list:
+        """Up to batch_size events, waiting at most `timeout` seconds"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        try:
+            with self._write_lock, tracer.span("audit_write", rows=len(batch)), \
+                    get_pool(self.db_path).connection() as conn:
+                conn.executemany(_AUDIT_INSERT, batch)
+                conn.commit()
+            self.written += len(batch)
+            self.batches += 1
+            result_cache.invalidate_tables(os.path.abspath(self.db_path), ("audit_log",))
+        except Exception as e:
+            self.dropped += len(batch)
+            print(f"[AUDIT ERROR] {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take(self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write every queued event now"""
+        while True:
+            batch = self._take(0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "batches": self.batches,
+                "blocked": self.blocked, "dropped": self.dropped}
+
+
+_audit_writers = {}
+_audit_writers_lock = threading.Lock()
+
+
+def get_audit_writer(db_path=DB_PATH) -> AuditWriter:
+    key = os.path.abspath(db_path)
+    with _audit_writers_lock:
+        if key not in _audit_writers:
+            _audit_writers[key] = AuditWriter(db_path)
+        return _audit_writers[key]
+
+
+def flush_audit_log(db_path=None):
+    """Write buffered audit events (for one DB, or all) before reading audit_log"""
+    with _audit_writers_lock:
+        writers = list(_audit_writers.values())
+    for writer in writers:
+        if db_path is None or writer.db_path == db_path or \
+                os.path.abspath(writer.db_path) == os.path.abspath(db_path):
+            writer.flush()
+
+
+@atexit.register
+def _close_audit_writers():
+    with _audit_writers_lock:
+        writers = list(_audit_writers.values())
+    for writer in writers:
+        writer.close()
+
+
 def log_db_action(user, action, table_name, record_id="", details="", db_path=DB_PATH):
-    """Log DB changes"""
+    """Log DB changes (buffered, see AuditWriter)"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO audit_log (user, action, table_name, record_id, details)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user, action, table_name, record_id, details))
-        conn.commit()
-        conn.close()
+        get_audit_writer(db_path).log(user, action, table_name, record_id, details)
     except Exception as e:
         print(f"[AUDIT ERROR] {e}")
 
 
 # ------------------- BACKUP & RESTORE ------------------- #
-def create_backup():
-    """Create timestamped backup of the DB"""
+class _HashingWriter:
+    """File wrapper that hashes and counts every byte written"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        return self.fileobj.flush()
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_backup_manifest(backup_file: str):
+    """Manifest dict stored next to a compressed backup, or None"""
+    manifest_file = backup_file[:-len(".db.zst")] + ".manifest.json"
+    if not backup_file.endswith(".db.zst") or not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def online_copy(db_path, target_file, progress=None, pages=BACKUP_PAGES_PER_STEP):
+    """
+    Consistent copy of a live DB via the SQLite backup API in `pages`-page
+    steps; returns (page_size, page_count) of the copy
+    """
+    def on_copy(status, remaining, total):
+        if progress:
+            progress("copy", total - remaining, total)
+
+    with get_pool(db_path).connection() as src:
+        dst = sqlite3.connect(target_file)
+        try:
+            src.backup(dst, pages=pages, progress=on_copy, sleep=BACKUP_STEP_SLEEP)
+            page_size = dst.execute("PRAGMA page_size;").fetchone()[0]
+            page_count = dst.execute("PRAGMA page_count;").fetchone()[0]
+        finally:
+            dst.close()
+    return page_size, page_count
+
+
+def create_backup(db_path=DB_PATH, progress=None, pages=BACKUP_PAGES_PER_STEP):
+    """
+    Create timestamped backup of the DB:
+    - online copy through the SQLite backup API, `pages` pages per step
+      (writers are not blocked between steps)
+    - zstd-compressed (.db.zst) with a checksum manifest (.manifest.json)
+    - progress(stage, done, total) is called for "copy" and "compress"
+    """
+    tmp_file = None
     try:
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        backup_file = os.path.join(BACKUP_DIR, f"company_{timestamp}.db")
-        shutil.copy(DB_PATH, backup_file)
-        return {"success": True, "message": f"Backup created: {backup_file}"}
+        base = os.path.join(BACKUP_DIR, f"company_{timestamp}")
+        backup_file = base + ".db.zst"
+        tmp_file = base + ".db.tmp"
+
+        page_size, page_count = online_copy(db_path, tmp_file, progress, pages)
+
+        raw_size = os.path.getsize(tmp_file)
+        raw_sha = hashlib.sha256()
+        compressor = zstd.ZstdCompressor(level=BACKUP_ZSTD_LEVEL)
+        with open(tmp_file, "rb") as fin, open(backup_file, "wb") as fout:
+            out = _HashingWriter(fout)
+            with compressor.stream_writer(out, size=raw_size, closefd=False) as writer:
+                done = 0
+                for chunk in iter(lambda: fin.read(BACKUP_CHUNK_SIZE), b""):
+                    raw_sha.update(chunk)
+                    writer.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress("compress", done, raw_size)
+
+        manifest = {
+            "backup": os.path.basename(backup_file),
+            "created": timestamp,
+            "source": os.path.abspath(db_path),
+            "format": "sqlite+zstd",
+            "page_size": page_size,
+            "page_count": page_count,
+            "size": raw_size,
+            "sha256": raw_sha.hexdigest(),
+            "compressed_size": out.size,
+            "compressed_sha256": out.sha256.hexdigest(),
+        }
+        with open(base + ".manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        ratio = out.size / raw_size if raw_size else 1
+        return {
+            "success": True,
+            "message": f"Backup created: {backup_file} ({raw_size:,} → {out.size:,} bytes, {ratio:.0%})",
+            "file": backup_file,
+            "manifest": manifest,
+        }
     except Exception as e:
         return {"success": False, "message": f"Backup failed: {e}"}
+    finally:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def decompress_backup(backup_file: str, target_file: str):
+    """Stream-decompress a .db.zst backup, verifying the manifest checksums"""
+    manifest = read_backup_manifest(backup_file)
+    if manifest and _file_sha256(backup_file) != manifest["compressed_sha256"]:
+        raise ValueError("compressed backup checksum mismatch")
+
+    raw_sha = hashlib.sha256()
+    decompressor = zstd.ZstdDecompressor()
+    with open(backup_file, "rb") as fin, open(target_file, "wb") as fout:
+        with decompressor.stream_reader(fin) as reader:
+            for chunk in iter(lambda: reader.read(BACKUP_CHUNK_SIZE), b""):
+                raw_sha.update(chunk)
+                fout.write(chunk)
+
+    if manifest and raw_sha.hexdigest() != manifest["sha256"]:
+        os.remove(target_file)
+        raise ValueError("backup checksum mismatch after decompression")
+
+
+def list_backups():
+    """Restorable backup files in BACKUP_DIR, newest first"""
+    if not os.path.exists(BACKUP_DIR):
+        return []
+    files = [f for f in os.listdir(BACKUP_DIR) if f.endswith((".db", ".db.zst"))]
+    return sorted(files, reverse=True)
+
+
+def invalidate_db_caches(db_path=DB_PATH, close_connections=True):
+    """Forget everything cached about a DB after its content was replaced"""
+    key = os.path.abspath(db_path)
+    result_cache.clear(key)
+    _schema_fingerprints.pop(key, None)
+    _schema_indexes.pop(key, None)
+    for cached_key in [k for k in _statement_tables if k[0] == key]:
+        _statement_tables.pop(cached_key, None)
+    if close_connections:
+        get_pool(db_path).close_all()
+
+
+def validate_backup(db_file: str) -> dict:
+    """integrity_check on a backup file opened read-only (never modified)"""
+    uri = f"file:{os.path.abspath(db_file)}?mode=ro&immutable=1"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        status = conn.execute("PRAGMA integrity_check;").fetchone()[0]
+        tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table';").fetchone()[0]
+    finally:
+        conn.close()
+    if status != "ok":
+        return {"valid": False, "error": f"integrity_check failed: {status}"}
+    if not tables:
+        return {"valid": False, "error": "backup contains no tables"}
+    return {"valid": True}
 
 
-def restore_backup(backup_file: str):
-    """Restore the DB"""
+def restore_backup(backup_file: str, db_path=None):
+    """
+    Restore the DB (.db copies or compressed .db.zst backups):
+    - compressed backups are stream-decompressed to a temporary file
+    - the file is validated with integrity_check before anything is touched
+    - content is swapped in with the SQLite backup API in one write
+      transaction, so live connections see either the old or the new DB
+    - pooled connections and caches are invalidated afterwards
+    """
+    db_path = db_path or DB_PATH
+    start = time.perf_counter()
+    tmp_file = None
     try:
-        shutil.copy(backup_file, DB_PATH)
-        return {"success": True, "message": f"Database restored from {backup_file}"}
+        source = backup_file
+        if backup_file.endswith(".zst"):
+            tmp_file = os.path.join(os.path.dirname(os.path.abspath(db_path)),
+                                    f".{os.path.basename(db_path)}.restore-{time.time_ns()}.tmp")
+            decompress_backup(backup_file, tmp_file)
+            source = tmp_file
+
+        check = validate_backup(source)
+        if not check["valid"]:
+            return {"success": False, "message": f"Restore failed: {check['error']}"}
+
+        src = sqlite3.connect(f"file:{os.path.abspath(source)}?mode=ro&immutable=1", uri=True)
+        try:
+            with get_pool(db_path).connection() as dst:
+                src.backup(dst, pages=-1)      # single step: one write transaction
+        finally:
+            src.close()
+
+        invalidate_db_caches(db_path)
+        elapsed = time.perf_counter() - start
+        return {
+            "success": True,
+            "message": f"Database restored from {backup_file} in {elapsed:.2f}s",
+            "elapsed_ms": round(elapsed * 1000, 2),
+        }
     except Exception as e:
         return {"success": False, "message": f"Restore failed: {e}"}
+    finally:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
 
 
 # ------------------- MFA (2FA) ------------------- #